@@ -0,0 +1,78 @@
+"""
+Times SqlMinuteBarWriter on --rows random minute bars, written once to
+empty tables then again over themselves, against the DELETE + to_sql
+path it replaced, run on the first --legacy-rows bars.
+
+    python benchmarks/bench_bar_writer.py --rows 1000000
+    python benchmarks/bench_bar_writer.py --db-url $DATABASE_URL --layout shared
+
+Tables are dropped first. Defaults to a temporary sqlite database.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, BigInteger
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forex_toolbox.data.bar_schema import bar_table, shared_bar_table, ensure_table  # noqa: E402
+from forex_toolbox.data.sql_bar_writer import SqlMinuteBarWriter  # noqa: E402
+
+SYMBOL = 'EUR_USD'
+
+
+def legacy_write(engine, df, page=500):
+    """ The original path: per page, DELETE the minutes then to_sql row inserts """
+    ensure_table(engine, SYMBOL)
+    t = bar_table(SYMBOL)
+    for start in range(0, len(df), page):
+        chunk = df.iloc[start:start + page]
+        chunk = chunk.set_index(chunk.index.values.astype('datetime64[ns]').view(np.int64))
+        c = engine.connect()
+        c.execute(t.delete().where(t.c.ts.in_([int(ts) for ts in chunk.index])))
+        c.close()
+        chunk.to_sql(name=t.name, con=engine, index_label='ts', dtype={'ts': BigInteger}, if_exists='append')
+
+
+def timed(label, rows, func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    elapsed = time.time() - start
+    print('{:<40} {:>8.2f}s {:>12.0f} bars/s'.format(label, elapsed, rows / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db-url')
+    parser.add_argument('--layout', default='per_symbol')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--legacy-rows', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    db_url = args.db_url or 'sqlite:///{}'.format(os.path.join(tempfile.mkdtemp(), 'bars.db'))
+    engine = create_engine(db_url)
+    for table in [bar_table(SYMBOL), shared_bar_table()]:
+        table.drop(engine, checkfirst=True)
+
+    random = np.random.RandomState(0)
+    close = 111000 + np.cumsum(random.randint(-5, 6, args.rows))
+    df = pd.DataFrame({'open': close, 'high': close + 3, 'low': close - 3, 'close': close,
+                       'volume': random.randint(1, 100, args.rows)},
+                      index=pd.date_range('2010-01-01', periods=args.rows, freq='1min'))
+
+    writer = SqlMinuteBarWriter(engine, args.layout, args.batch_size)
+    timed('write, {} bars'.format(args.rows), args.rows, writer.write, SYMBOL, df)
+    timed('write again, {} bars'.format(args.rows), args.rows, writer.write, SYMBOL, df)
+
+    if args.legacy_rows and args.layout == 'per_symbol':
+        bar_table(SYMBOL).drop(engine)
+        legacy = df.iloc[:args.legacy_rows]
+        timed('legacy write, {} bars'.format(len(legacy)), len(legacy), legacy_write, engine, legacy)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Times the Oanda broker's order, position and history calls against a local
+stub of oanda's REST API, answering after --delay milliseconds, and prints
+the p50/p99 of each method and phase in microseconds.
+
+    python benchmarks/bench_oanda_latency.py --calls 2000
+    python benchmarks/bench_oanda_latency.py --delay 5 --json latency.json
+
+--json writes the histograms, to compare runs across releases.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forex_toolbox.broker.oanda import Oanda  # noqa: E402
+
+ACCOUNT_ID = 'bench'
+
+
+class StubServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 64
+
+
+def candles(count):
+    return {'instrument': 'EUR_USD',
+            'granularity': 'M1',
+            'candles': [{'time': '2016-09-01T00:{:02d}:00.000000Z'.format(i % 60),
+                         'openMid': 1.1, 'highMid': 1.1002, 'lowMid': 1.0999, 'closeMid': 1.1001,
+                         'volume': 10, 'complete': True}
+                        for i in range(count)]}
+
+
+def stub_server(delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written apart, which Nagle would delay
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.endswith('/candles'):
+                self.reply(candles(int(dict(parse_qsl(url.query)).get('count', 500))))
+            else:
+                self.reply({'instrument': 'EUR_USD', 'units': 10, 'side': 'buy', 'avgPrice': 1.1})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.reply({'instrument': 'EUR_USD', 'price': 1.1, 'tradeOpened': {'id': 1, 'units': 10}})
+
+        def do_DELETE(self):
+            self.reply({'instrument': 'EUR_USD', 'totalUnits': 10, 'price': 1.1, 'ids': [1]})
+
+        def reply(self, body):
+            time.sleep(delay)
+            body = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = StubServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+WORKLOADS = {
+    'order': lambda broker: broker.create_order('EUR_USD', 100, order_type='limit', price=1.1,
+                                                stop_loss=1.09, take_profit=1.12),
+    'position': lambda broker: (broker.get_position('EUR_USD'), broker.close_position('EUR_USD')),
+    'history': lambda broker: broker.get_history('EUR_USD', count=500),
+}
+
+
+def report(latency):
+    print('{:<16} {:<10} {:>8} {:>10} {:>10} {:>10}'.format('method', 'phase', 'calls', 'p50 us', 'p99 us', 'max us'))
+    for method, phases in sorted(latency.to_dict().items()):
+        for phase in ['wall', 'serialize', 'network']:
+            h = phases[phase]
+            print('{:<16} {:<10} {:>8} {:>10} {:>10} {:>10}'.format(
+                method, phase, h['count'], h['percentiles']['50'], h['percentiles']['99'], h['max']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=1000, help='calls per workload')
+    parser.add_argument('--delay', type=float, default=0.0, help='stub server delay, in milliseconds')
+    parser.add_argument('--workloads', default=','.join(sorted(WORKLOADS)))
+    parser.add_argument('--json', help='path of the json histograms')
+    args = parser.parse_args()
+
+    server = stub_server(args.delay / 1000.0)
+    broker = Oanda(ACCOUNT_ID)
+    broker.oanda.api_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    workloads = args.workloads.split(',')
+    # Warms up the connection
+    for name in workloads:
+        WORKLOADS[name](broker)
+    broker.latency.reset()
+
+    for name in workloads:
+        start = time.time()
+        for _ in range(args.calls):
+            WORKLOADS[name](broker)
+        print('{:<10} {} calls in {:.2f}s'.format(name, args.calls, time.time() - start))
+    print('')
+    report(broker.latency)
+    if args.json:
+        broker.latency.to_json(args.json)
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Times resample.range_bars on a random walk of --rows ticks, against the
+reference python loop it replaced, run on the first --loop-rows ticks.
+
+    python benchmarks/bench_range_bars.py --rows 20000000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forex_toolbox.utils import resample  # noqa: E402
+
+
+def reference_range_bars(prices, pips=5, pip_size=1e-4):
+    """ The original loop implementation, kept as the reference """
+    int_prices = (prices / pip_size).round(0).astype(int)
+    range_bars = [0]
+    current_level = int_prices.iloc[0]
+
+    for price in int_prices:
+        change = price - current_level
+        while change > pips:
+            range_bars.append(1)
+            change -= pips + 1
+            current_level += pips + 1
+        while change < -pips:
+            range_bars.append(0)
+            change += pips + 1
+            current_level -= pips + 1
+
+    return pd.Series(range_bars[1:])
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    print('{:<40} {:>8.2f}s'.format(label, time.time() - start))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000000)
+    parser.add_argument('--loop-rows', type=int, default=1000000)
+    parser.add_argument('--pips', type=int, default=3)
+    parser.add_argument('--tick-std', type=float, default=3e-5,
+                        help='standard deviation of tick to tick price changes')
+    args = parser.parse_args()
+
+    random = np.random.RandomState(0)
+    prices = pd.Series(1.1 + np.cumsum(random.normal(0, args.tick_std, args.rows)),
+                       index=pd.date_range('2016-07-01', periods=args.rows, freq='250ms'))
+
+    bars = timed('range_bars, {} ticks'.format(args.rows),
+                 resample.range_bars, prices, pips=args.pips)
+    print('{} bars'.format(len(bars)))
+
+    head = prices.iloc[:args.loop_rows]
+    expected = timed('reference loop, {} ticks'.format(len(head)),
+                     reference_range_bars, head, pips=args.pips)
+    assert list(resample.range_bars(head, pips=args.pips)) == list(expected)
+
+
+if __name__ == '__main__':
+    main()
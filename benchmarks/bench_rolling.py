@@ -0,0 +1,60 @@
+"""
+Times each indicators.rolling backend on random walks of 1e3 to 1e8 rows,
+to find where they cross over on this machine, next to the one
+rolling_min_max picks by default. The pure python deque backend is only
+timed up to --deque-max rows.
+
+    python benchmarks/bench_rolling.py --max-size 100000000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forex_toolbox.indicators import rolling  # noqa: E402
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-size', type=int, default=1000)
+    parser.add_argument('--max-size', type=int, default=100000000)
+    parser.add_argument('--window', type=int, default=26)
+    parser.add_argument('--deque-max', type=int, default=1000000,
+                        help='largest size the pure python deque backend is timed on')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>12} {:>12} {:>12} {:>12} {:>10}'.format('size', *(rolling.BACKENDS + ('picked',))))
+    size = args.min_size
+    while size <= args.max_size:
+        values = 1 + np.random.RandomState(0).randn(size).cumsum() * 1e-4
+        repeat = args.repeat if size < 10000000 else 1
+        timings, expected = [], None
+        for backend in rolling.BACKENDS:
+            if backend == 'deque' and size > args.deque_max:
+                timings.append('-')
+                continue
+            elapsed, result = best_time(lambda: rolling.rolling_min_max(values, args.window, backend), repeat)
+            if expected is None:
+                expected = result
+            else:
+                for actual, wanted in zip(result, expected):
+                    np.testing.assert_array_equal(actual, wanted)
+            timings.append('{:.2e}s'.format(elapsed))
+        print('{:>12} {:>12} {:>12} {:>12} {:>10}'.format(size, *(timings + [rolling.pick_backend(size)])))
+        size *= 10
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmarks resample.parse_truefx_datetimes against pandas' generic
+datetime parsing, on truefx ticks like fixtures/bid_ask.csv scaled up to
+--rows rows.
+
+    python benchmarks/bench_truefx_datetimes.py --rows 20000000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forex_toolbox.utils import resample  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fixtures', 'bid_ask.csv')
+
+
+def truefx_datetimes(rows):
+    """
+    Unique, increasing truefx datetime strings, starting at the first
+    tick of the fixture, about 4 ticks a second like the fixture
+    """
+    fixture = pd.read_csv(FIXTURE, header=None, names=['name', 'datetime', 'bid', 'ask'], parse_dates=[1])
+    first = fixture.datetime.iloc[0]
+    datetimes = pd.DatetimeIndex(first + pd.to_timedelta(np.arange(rows) * 237, unit='ms'))
+
+    # Formats in bulk, strftime on tens of millions of rows takes minutes
+    chars = np.full((rows, resample.TRUEFX_DATETIME_WIDTH), ord('0'), dtype=np.uint8)
+    for position, separator in resample.TRUEFX_DATETIME_SEPARATORS:
+        chars[:, position] = ord(separator)
+    fields = [(0, 4, datetimes.year), (4, 6, datetimes.month), (6, 8, datetimes.day),
+              (9, 11, datetimes.hour), (12, 14, datetimes.minute), (15, 17, datetimes.second),
+              (18, 21, datetimes.microsecond // 1000)]
+    for start, stop, values in fields:
+        values = np.asarray(values, dtype=np.int64)
+        for position in reversed(range(start, stop)):
+            chars[:, position] += (values % 10).astype(np.uint8)
+            values = values // 10
+    return chars.view('S{}'.format(resample.TRUEFX_DATETIME_WIDTH)).ravel().astype(str)
+
+
+def write_ticks(path, datetimes):
+    fixture = pd.read_csv(FIXTURE, header=None, names=['name', 'datetime', 'bid', 'ask'])
+    repeats = len(datetimes) // len(fixture) + 1
+    df = pd.DataFrame({'name': 'EUR/USD',
+                       'datetime': datetimes,
+                       'bid': np.tile(fixture.bid.values, repeats)[:len(datetimes)],
+                       'ask': np.tile(fixture.ask.values, repeats)[:len(datetimes)]})
+    df.to_csv(path, header=False, index=False, columns=['name', 'datetime', 'bid', 'ask'])
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    print('{:<40} {:>8.2f}s'.format(label, time.time() - start))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000000)
+    parser.add_argument('--csv', action='store_true',
+                        help='also time bid_ask_to_ohlc end to end on a generated csv')
+    args = parser.parse_args()
+
+    print('Generating {} truefx datetimes'.format(args.rows))
+    datetimes = truefx_datetimes(args.rows)
+    values = datetimes.astype(object)
+
+    generic = timed('pd.to_datetime', pd.to_datetime, values)
+    fast = timed('parse_truefx_datetimes', resample.parse_truefx_datetimes, values)
+    assert (generic.values.astype('datetime64[ns]').astype(np.int64) == fast).all()
+
+    if args.csv:
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            timed('writing csv', write_ticks, f.name, datetimes)
+            slow = timed('bid_ask_to_ohlc', resample.bid_ask_to_ohlc, f.name,
+                         chunksize=resample.DEFAULT_CHUNKSIZE)
+            fast = timed('bid_ask_to_ohlc(fast_dates=True)', resample.bid_ask_to_ohlc, f.name,
+                         chunksize=resample.DEFAULT_CHUNKSIZE, fast_dates=True)
+            assert slow.equals(fast)
+
+
+if __name__ == '__main__':
+    main()
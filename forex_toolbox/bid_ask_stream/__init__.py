@@ -1 +1 @@
-from .bid_ask_stream import ingest
+from .bid_ask_stream import ingest, read_spreads
@@ -3,14 +3,27 @@ Reads csv file of streamed bid and ask prices, then ingests into
 zipline data.bundle
 - Set BID_ASK_STREAM_CSV_FOLDER=path, where path contains the csv data as seen
 in _minute_iter docstring
+- Optionally set BID_ASK_STREAM_CHUNKSIZE=rows, the number of csv rows
+resampled at a time (defaults to resample.DEFAULT_CHUNKSIZE)
+- Optionally set BID_ASK_STREAM_PROCESSES=n to resample csv files in a pool
+of n worker processes (defaults to 1, in process)
+- Optionally set BID_ASK_STREAM_CACHE_FOLDER=path, where the manifest of
+processed files and their cached minute bars are kept (defaults to
+$ZIPLINE_ROOT/bid_ask_stream). Only new or changed files are resampled.
+- Optionally set BID_ASK_STREAM_SPREADS=true to also keep bid/ask ohlc and
+spread statistics of every minute bar (see resample.spread_bars), written
+per sid under <bundle>/spreads and loaded with read_spreads
 """
 import os
 import re
+import multiprocessing
 import zipfile
 import pandas as pd
 import numpy as np
 from ..utils import resample
+from .manifest import Manifest, file_digest, read_bars
 from zipline.utils.cli import maybe_show_progress
+from zipline.utils.paths import zipline_root
 
 
 def ingest(environ,
@@ -46,6 +59,12 @@ def ingest(environ,
             ...
     """
     path = environ.get('BID_ASK_STREAM_CSV_FOLDER')
+    chunksize = int(environ.get('BID_ASK_STREAM_CHUNKSIZE',
+                                resample.DEFAULT_CHUNKSIZE))
+    processes = int(environ.get('BID_ASK_STREAM_PROCESSES', 1))
+    spreads = environ.get('BID_ASK_STREAM_SPREADS', 'false') == 'true'
+    manifest = Manifest(environ.get('BID_ASK_STREAM_CACHE_FOLDER',
+                                    os.path.join(zipline_root(environ), 'bid_ask_stream')))
     instruments = os.listdir(path)  # get ["EURSD", "AUDUSD"]
 
     # init metadata
@@ -88,37 +107,193 @@ def ingest(environ,
         Note
         ----
         sid is index of insturment folder in the path. No special meaning.
+        Zip archives are read in place, they are never extracted.
+        Each csv file is resampled as a separate job, in a process pool
+        when processes > 1. Results come back in job order, so they are
+        still yielded by sid and chronologically.
+        Sources unchanged since a previous ingest are not resampled, their
+        bars are read back from the manifest's cache. Files are hashed
+        once, however many csv members an archive holds.
+        With spreads, the spread columns are split off the bars and
+        written once per sid.
         """
-        instruments = os.listdir(path)  # get ["EURSD", "AUDUSD"]
+        jobs, keys, digests = [], [], {}
         for index, name in enumerate(instruments):
             metadata.ix[index] = None, None, None, 'NYSE', name, name
-            current_dir = os.path.join(path, name)
+            for source in _instrument_sources(os.path.join(path, name)):
+                key = _source_key(path, source, spreads)
+                cached_bars = manifest.cached_bars(key, source[0], digests)
+                if cached_bars is None and source[0] not in digests:
+                    digests[source[0]] = file_digest(source[0])
+                jobs.append((index, source, chunksize, spreads, cached_bars,
+                             digests.get(source[0]) if cached_bars is None else None))
+                keys.append(key)
 
-            zips = filter(lambda x: ".zip" in x, os.listdir(current_dir))
-            for z in zips:
-                zfile = zipfile.ZipFile(os.path.join(current_dir, z), 'r')
-                zfile.extractall(current_dir)
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap(_resample_job, jobs)
+        else:
+            results = map(_resample_job, jobs)
 
-            # ensure data is ingested chronologically
-            sorted_csv_name = sorted(os.listdir(current_dir), key=lambda x: (int(re.sub('\D', '', x)), x))
-
-            csvs = filter(lambda x: ".csv" in x, sorted_csv_name)
+        try:
             with maybe_show_progress(
-                    csvs,
+                    results,
                     show_progress,
-                    label='Ingesting csv stream for %s: ' % name):
-                for minute_csv in csvs:
-                    ohlc = resample.bid_ask_to_ohlc(os.path.join(current_dir, minute_csv))
-
-                    # Keep metadata updated
-                    if metadata.ix[index, "start_date"] is pd.NaT or metadata.start_date.ix[index] > ohlc.index[0]:
-                        metadata.ix[index, "start_date"] = ohlc.index[0]
-                    if metadata.ix[index, "end_date"] is pd.NaT or metadata.end_date.ix[index] < ohlc.index[-1]:
-                        metadata.ix[index, "end_date"] = ohlc.index[-1]
-                        metadata.ix[index, "auto_close_date"] = ohlc.index[-1] + pd.Timedelta(days=1)
+                    length=len(jobs),
+                    label='Ingesting csv stream: ') as bar:
+                current, start, end, spread_bars = None, None, None, []
+                for (index, ohlc, digest), job, key in zip(bar, jobs, keys):
+                    if digest is not None:
+                        manifest.record(key, job[1][0], digest, ohlc)
+                    if index != current:
+                        _update_metadata(current, start, end)
+                        _write_spreads(output_dir, current, spread_bars)
+                        manifest.save()
+                        current, start, end, spread_bars = index, None, None, []
+                    if len(ohlc):
+                        start = ohlc.index[0] if start is None else min(start, ohlc.index[0])
+                        end = ohlc.index[-1] if end is None else max(end, ohlc.index[-1])
+                    if spreads:
+                        spread_bars.append(ohlc[resample.SPREAD_COLUMNS])
+                        ohlc = ohlc.drop(resample.SPREAD_COLUMNS, axis=1)
                     yield index, ohlc
+                _update_metadata(current, start, end)
+                _write_spreads(output_dir, current, spread_bars)
+            manifest.save(prune=True)
+        except BaseException:
+            # workers may be midway through other files, don't wait for them
+            if pool is not None:
+                pool.terminate()
+            raise
+        else:
+            if pool is not None:
+                pool.close()
+        finally:
+            if pool is not None:
+                pool.join()
+
+    def _update_metadata(index, start, end):
+        """ Sets the date range of an instrument, once all its csv are resampled """
+        if index is None or start is None:
+            return
+        metadata.ix[index, "start_date"] = start
+        metadata.ix[index, "end_date"] = end
+        metadata.ix[index, "auto_close_date"] = end + pd.Timedelta(days=1)
 
     minute_bar_writer.write(_minute_iter(path), show_progress)
     asset_db_writer.write(equities=metadata)
 
     adjustment_writer.write()
+
+
+def _instrument_sources(current_dir):
+    """
+    Lists the csv data of an instrument folder, in chronological order.
+    Csv members of zip archives are read in place, without extracting
+    them to disk.
+
+    Returns
+    -------
+    list of (path, member) tuples, member being None for plain csv files
+    """
+    sources = []
+    names = os.listdir(current_dir)
+    for z in filter(lambda x: x.endswith(".zip"), names):
+        with zipfile.ZipFile(os.path.join(current_dir, z), 'r') as zfile:
+            sources.extend((os.path.join(current_dir, z), member)
+                           for member in zfile.namelist()
+                           if member.endswith(".csv"))
+
+    # skip csv files previously extracted next to their archive
+    members = set(os.path.basename(member) for _, member in sources)
+    sources.extend((os.path.join(current_dir, csv), None)
+                   for csv in names
+                   if csv.endswith(".csv") and csv not in members)
+
+    # ensure data is ingested chronologically
+    def chronological(source):
+        name = os.path.basename(source[1] or source[0])
+        return (int(re.sub('\D', '', name)), name)
+    return sorted(sources, key=chronological)
+
+
+def _resample_job(job):
+    """
+    Resamples one csv file into minute bars, or reads them back from the
+    manifest's cache. Module level, so it can be pickled into worker
+    processes.
+
+    Parameters
+    ----------
+    job : tuple
+        (sid, (path, member), chunksize, spreads, cached_bars, digest),
+        digest being the sha1 of path, computed once per file by the
+        parent
+
+    Returns
+    -------
+    (sid, dataframe, digest)
+        digest is the sha1 of path when the bars were resampled, None when
+        they came from the cache.
+    """
+    index, (path, member), chunksize, spreads, cached_bars, digest = job
+    if cached_bars is not None:
+        return index, read_bars(cached_bars), None
+
+    if member is None:
+        return index, resample.bid_ask_to_ohlc(path, chunksize=chunksize, fast_dates=True,
+                                               spreads=spreads), digest
+
+    with zipfile.ZipFile(path, 'r') as zfile:
+        with zfile.open(member) as csv:
+            return index, resample.bid_ask_to_ohlc(csv, chunksize=chunksize, fast_dates=True,
+                                                   spreads=spreads), digest
+
+
+def _source_key(root, source, spreads=False):
+    """
+    Manifest key of a (path, member) source, relative to the data folder.
+    Bars with spreads are cached under their own key.
+    """
+    path, member = source
+    key = os.path.relpath(path, root)
+    if member is not None:
+        key = '{}::{}'.format(key, member)
+    if spreads:
+        key += '#spreads'
+    return key
+
+
+def _spreads_path(bundle_dir, sid):
+    return os.path.join(bundle_dir, 'spreads', '{}.pkl'.format(sid))
+
+
+def _write_spreads(bundle_dir, sid, spread_bars):
+    """ Writes the spread bars of a sid, if any, see read_spreads """
+    if sid is None or not spread_bars:
+        return
+    path = _spreads_path(bundle_dir, sid)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    pd.concat(spread_bars).to_pickle(path)
+
+
+def read_spreads(bundle_dir, sid):
+    """
+    Loads the bid/ask ohlc and spread statistics ingested with
+    BID_ASK_STREAM_SPREADS=true.
+
+    Parameters
+    ----------
+    bundle_dir : str
+        The ingested bundle folder, e.g.
+        $ZIPLINE_ROOT/data/bid_ask_stream/<timestamp>
+    sid : int
+
+    Returns
+    -------
+    pd.DataFrame
+        Minute bars with resample.SPREAD_COLUMNS, prices in 1e-5 units
+    """
+    return pd.read_pickle(_spreads_path(bundle_dir, sid))
@@ -0,0 +1,147 @@
+"""
+Keeps track of the bid/ask csv sources already resampled by
+bid_ask_stream.ingest, so that later runs only resample new or changed
+files and reuse the cached minute bars of the others.
+"""
+import os
+import json
+import hashlib
+import pandas as pd
+
+
+class Manifest(object):
+    """
+    A json file recording, for every resampled source, the size, mtime and
+    sha1 of the file it was read from, the minute bar range it produced,
+    and the pickle the bars are cached in. For example:
+
+        {"EURUSD/EURUSD-2016-07.zip::EURUSD-2016-07.csv": {
+            "size": 24315922, "mtime": 1470000000.0, "sha1": "9b0e...",
+            "start": "2016-07-01T00:00:00+00:00",
+            "end": "2016-07-29T20:59:00+00:00",
+            "bars": "3f1c....pkl"}}
+
+    Parameters
+    ----------
+    folder : str
+        Folder holding manifest.json and the cached bars. Created if
+        missing.
+    """
+
+    FILENAME = 'manifest.json'
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILENAME)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        self._seen = set()
+
+    def cached_bars(self, key, path, digests=None):
+        """
+        Parameters
+        ----------
+        key : str
+            Identifies the source, see bid_ask_stream._source_key
+        path : str
+            The file the source is read from, csv or zip archive
+        digests : dict, optional
+            {path: sha1} of files already hashed, shared by the members
+            of an archive. Updated when path is hashed.
+
+        Returns
+        -------
+        str or None
+            Path of the cached bars, or None when the source is new or
+            has changed since it was recorded. The content hash is only
+            computed when size matches but mtime doesn't.
+        """
+        self._seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        stat = os.stat(path)
+        if entry['size'] != stat.st_size:
+            return None
+        if entry['mtime'] != stat.st_mtime:
+            if digests is None:
+                digests = {}
+            if path not in digests:
+                digests[path] = file_digest(path)
+            if entry['sha1'] != digests[path]:
+                return None
+            entry['mtime'] = stat.st_mtime
+
+        bars = os.path.join(self.folder, entry['bars'])
+        return bars if os.path.exists(bars) else None
+
+    def record(self, key, path, digest, ohlc):
+        """
+        Caches the bars resampled from a source, and records it.
+
+        Parameters
+        ----------
+        key : str
+            Identifies the source, see bid_ask_stream._source_key
+        path : str
+            The file the source was read from, csv or zip archive
+        digest : str
+            sha1 hex digest of path, as returned by file_digest
+        ohlc : pd.DataFrame
+            The minute bars resampled from the source
+        """
+        stat = os.stat(path)
+        bars = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl'
+        ohlc.to_pickle(os.path.join(self.folder, bars))
+
+        self.entries[key] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha1': digest,
+            'start': ohlc.index[0].isoformat() if len(ohlc) else None,
+            'end': ohlc.index[-1].isoformat() if len(ohlc) else None,
+            'bars': bars,
+        }
+        self._seen.add(key)
+
+    def save(self, prune=False):
+        """
+        Writes the manifest to disk, atomically.
+
+        Parameters
+        ----------
+        prune : bool
+            If true, also forgets the sources not looked up or recorded
+            since the manifest was loaded, and deletes their cached bars.
+            Only pass it once every source of a run has been seen.
+        """
+        if prune:
+            for key in set(self.entries) - self._seen:
+                bars = os.path.join(self.folder, self.entries.pop(key)['bars'])
+                if os.path.exists(bars):
+                    os.remove(bars)
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def read_bars(path):
+    """ Loads bars cached by Manifest.record """
+    return pd.read_pickle(path)
+
+
+def file_digest(path, blocksize=1 << 20):
+    """ sha1 hex digest of a file, read blocksize bytes at a time """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
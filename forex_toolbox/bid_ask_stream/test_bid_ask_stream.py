@@ -1,7 +1,11 @@
 import os
+import zipfile
+import multiprocessing
 import pytest
 
 from . import bid_ask_stream
+from .manifest import file_digest
+from ..utils import resample
 
 from datetime import datetime, timedelta
 import pytz
@@ -46,3 +50,47 @@ def test_max_with_tz():
     t = pd.Timestamp.max.replace(tzinfo=pytz.UTC)
     today = datetime.today().replace(tzinfo=pytz.UTC)
     assert t > today
+
+
+def test_resample_job_in_pool():
+    digest = file_digest('fixtures/bid_ask.csv')
+    jobs = [(0, ('fixtures/bid_ask.csv', None), 100, False, None, digest),
+            (1, ('fixtures/bid_ask.csv', None), None, False, None, digest)]
+    pool = multiprocessing.Pool(2)
+    try:
+        results = list(pool.imap(bid_ask_stream._resample_job, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+    expected = resample.bid_ask_to_ohlc('fixtures/bid_ask.csv')
+    assert [index for index, _, _ in results] == [0, 1]
+    for _, ohlc, job_digest in results:
+        assert ohlc.equals(expected)
+        assert job_digest == digest
+
+
+def test_zip_members_are_streamed(tmpdir):
+    csv = open('fixtures/bid_ask.csv').read()
+    archive = tmpdir.join('EURUSD-2016-07.zip')
+    with zipfile.ZipFile(str(archive), 'w') as zfile:
+        zfile.writestr('EURUSD-2016-07.csv', csv)
+    tmpdir.join('EURUSD-2016-06.csv').write(csv)
+
+    sources = bid_ask_stream._instrument_sources(str(tmpdir))
+    assert sources == [(str(tmpdir.join('EURUSD-2016-06.csv')), None),
+                       (str(archive), 'EURUSD-2016-07.csv')]
+    assert sorted(os.listdir(str(tmpdir))) == ['EURUSD-2016-06.csv', 'EURUSD-2016-07.zip']
+
+    _, ohlc, _ = bid_ask_stream._resample_job((0, sources[1], 500, False, None, None))
+    assert ohlc.equals(resample.bid_ask_to_ohlc('fixtures/bid_ask.csv'))
+
+
+def test_spreads_are_written_per_sid(tmpdir):
+    _, ohlc, _ = bid_ask_stream._resample_job((3, ('fixtures/bid_ask.csv', None), 500, True, None, None))
+    assert set(resample.SPREAD_COLUMNS) <= set(ohlc.columns)
+
+    bid_ask_stream._write_spreads(str(tmpdir), 3, [ohlc[resample.SPREAD_COLUMNS]])
+    spreads = bid_ask_stream.read_spreads(str(tmpdir), 3)
+    assert spreads.equals(ohlc[resample.SPREAD_COLUMNS])
+    assert (spreads.spread_max >= spreads.spread_mean).all()
@@ -0,0 +1,122 @@
+import os
+import pytest
+import pandas as pd
+
+from ..utils import resample
+from . import bid_ask_stream
+from . import manifest as manifest_module
+from .manifest import Manifest, file_digest, read_bars
+
+
+@pytest.fixture
+def source(tmpdir):
+    path = tmpdir.join('EURUSD-2016-07.csv')
+    path.write(open('fixtures/bid_ask.csv').read())
+    return str(path)
+
+
+@pytest.fixture
+def ohlc():
+    return resample.bid_ask_to_ohlc('fixtures/bid_ask.csv')
+
+
+def test_record_and_reuse(tmpdir, source, ohlc):
+    folder = str(tmpdir.join('cache'))
+    manifest = Manifest(folder)
+    assert manifest.cached_bars('EURUSD-2016-07.csv', source) is None
+
+    manifest.record('EURUSD-2016-07.csv', source, file_digest(source), ohlc)
+    manifest.save()
+
+    reloaded = Manifest(folder)
+    entry = reloaded.entries['EURUSD-2016-07.csv']
+    assert entry['size'] == os.path.getsize(source)
+    assert entry['start'] == ohlc.index[0].isoformat()
+    assert entry['end'] == ohlc.index[-1].isoformat()
+
+    bars = reloaded.cached_bars('EURUSD-2016-07.csv', source)
+    assert read_bars(bars).equals(ohlc)
+
+
+def test_touched_file_is_reused_changed_file_is_not(tmpdir, source, ohlc):
+    manifest = Manifest(str(tmpdir.join('cache')))
+    manifest.record('EURUSD-2016-07.csv', source, file_digest(source), ohlc)
+
+    stat = os.stat(source)
+    os.utime(source, (stat.st_atime, stat.st_mtime + 60))
+    assert manifest.cached_bars('EURUSD-2016-07.csv', source) is not None
+
+    with open(source, 'r+') as f:
+        f.write('GBP')
+    assert manifest.cached_bars('EURUSD-2016-07.csv', source) is None
+
+
+def test_archive_members_share_one_digest(tmpdir, source, ohlc, monkeypatch):
+    manifest = Manifest(str(tmpdir.join('cache')))
+    keys = ['EURUSD-2016-07.zip::EURUSD-2016-07-{}.csv'.format(week) for week in range(4)]
+    for key in keys:
+        manifest.record(key, source, file_digest(source), ohlc)
+
+    stat = os.stat(source)
+    os.utime(source, (stat.st_atime, stat.st_mtime + 60))
+    hashed = []
+    monkeypatch.setattr(manifest_module, 'file_digest',
+                        lambda path: hashed.append(path) or file_digest(path))
+
+    digests = {}
+    assert all(manifest.cached_bars(key, source, digests) is not None for key in keys)
+    assert hashed == [source]
+
+
+def test_save_prunes_unseen_sources(tmpdir, source, ohlc):
+    folder = str(tmpdir.join('cache'))
+    manifest = Manifest(folder)
+    manifest.record('EURUSD-2016-07.csv', source, file_digest(source), ohlc)
+    manifest.save()
+
+    manifest = Manifest(folder)
+    manifest.save(prune=True)
+
+    assert Manifest(folder).entries == {}
+    assert os.listdir(folder) == [Manifest.FILENAME]
+
+
+class _Writer(object):
+    """ Stands for the bundle writers, keeps what ingest writes """
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data=None, show_progress=False, **kwargs):
+        self.written.extend(data if data is not None else [kwargs])
+
+
+class _Calendar(object):
+    def __init__(self):
+        minutes = pd.date_range('2016-07-29', periods=2, freq='D')
+        self.schedule = pd.DataFrame({'market_open': minutes, 'market_close': minutes})
+
+
+def _ingest(environ, output_dir):
+    minute_bar_writer = _Writer()
+    bid_ask_stream.ingest(environ, _Writer(), minute_bar_writer, _Writer(), _Writer(), _Calendar(),
+                          None, None, None, False, output_dir)
+    return minute_bar_writer.written
+
+
+def test_second_ingest_does_not_resample(tmpdir, monkeypatch):
+    tmpdir.mkdir('stream').mkdir('EURUSD').join('EURUSD-2016-07.csv').write(
+        open('fixtures/bid_ask.csv').read())
+    environ = {'BID_ASK_STREAM_CSV_FOLDER': str(tmpdir.join('stream')),
+               'BID_ASK_STREAM_CACHE_FOLDER': str(tmpdir.join('cache'))}
+
+    first = _ingest(environ, str(tmpdir))
+    assert [sid for sid, _ in first] == [0]
+
+    resampled = []
+    monkeypatch.setattr(resample, 'bid_ask_to_ohlc', lambda *args, **kwargs: resampled.append(args))
+    second = _ingest(environ, str(tmpdir))
+
+    assert resampled == []
+    assert [sid for sid, _ in second] == [0]
+    assert second[0][1].equals(first[0][1])
@@ -1,2 +1,4 @@
 from .simu_broker import SimuBroker
 from .oanda import Oanda
+from .async_oanda import AsyncOanda, SyncOanda
+from .latency import LatencyHistogram, LatencyRecorder
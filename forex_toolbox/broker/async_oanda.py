@@ -0,0 +1,198 @@
+"""
+An asyncio client of oanda's REST API (see http://developer.oanda.com/rest-live),
+with the surface of Oanda, for issuing many requests at once:
+
+    broker = SyncOanda(account_id)
+    positions = broker.get_positions(['EUR_USD', 'USD_JPY', ...])
+
+Requests go through one requests.Session, keeping its connections alive,
+run by a pool of concurrency threads. Concurrency is bounded by these
+threads, each blocking on one request over its own connection: requests
+are not multiplexed over a single connection, and those beyond
+concurrency wait in the pool's queue.
+"""
+import os
+import json
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import oandapy
+import requests
+from requests.adapters import HTTPAdapter
+
+from .oanda import order_params, history_params
+
+API_URLS = {
+    'sandbox': 'http://api-sandbox.oanda.com',
+    'practice': 'https://api-fxpractice.oanda.com',
+    'live': 'https://api-fxtrade.oanda.com',
+}
+
+DEFAULT_CONCURRENCY = 10
+
+
+class AsyncOanda(object):
+    """
+    Parameters
+    ----------
+    id : str
+        Account id
+    concurrency : int
+        Requests in flight at once, and connections kept alive
+    environment : str
+        Defaults to the OANDA_ENV environment variable, or practice
+    access_token : str
+        Defaults to the OANDA_ACCESS_TOKEN environment variable
+    """
+
+    def __init__(self, id, concurrency=DEFAULT_CONCURRENCY, environment=None, access_token=None):
+        self.id = id
+        self.api_url = API_URLS[environment or os.getenv("OANDA_ENV", "practice")]
+        self.concurrency = concurrency
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Authorization'] = 'Bearer {}'.format(
+            access_token or os.getenv("OANDA_ACCESS_TOKEN", "xxx"))
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    async def get_account(self):
+        response = await self.request('GET', 'v1/accounts/{}'.format(self.id))
+        logging.info("#get_account params=%s response=%s" % ({"account_id": self.id}, response))
+        return response
+
+    async def create_order(self, instrument, amount, order_type='market',
+                           price=None, lower_bound=None, upper_bound=None, expiry=None,
+                           stop_loss=None, take_profit=None, trailling=None):
+        """
+        Creates an order, see Oanda.create_order
+
+        Return
+        ------
+        order_id: string
+            Oanda order id string
+        """
+        params = order_params(self.id, instrument, amount, order_type, price, lower_bound, upper_bound,
+                              expiry, stop_loss, take_profit, trailling)
+        account_id = params.pop("account_id")
+        try:
+            response = await self.request('POST', 'v1/accounts/{}/orders'.format(account_id), params)
+            logging.info("#create_order params=%s response=%s" % (params, response))
+            if "tradeOpened" in response:
+                return response["tradeOpened"]["id"]
+            elif "orderOpened" in response:
+                return response["orderOpened"]["id"]
+            else:
+                return response
+        except oandapy.OandaError as e:
+            logging.exception(e)
+            return None
+
+    async def close_position(self, instrument):
+        try:
+            response = await self.request('DELETE', 'v1/accounts/{}/positions/{}'.format(self.id, instrument))
+            logging.info("#close_position params=%s response=%s" % ({'id': self.id, 'instrument': instrument},
+                                                                    response))
+            return response
+        except oandapy.OandaError as e:
+            logging.exception(e)
+            return None
+
+    async def get_history(self, instrument, count=500, resolution="m1", end=None, candleFormat="midpoint",
+                          start=None):
+        """ See Oanda.get_history """
+        params = history_params(instrument, count, resolution, end, candleFormat, start)
+        response = await self.request('GET', 'v1/candles', params)
+        return response["candles"]
+
+    async def get_position(self, instrument):
+        try:
+            return await self.request('GET', 'v1/accounts/{}/positions/{}'.format(self.id, instrument.upper()))
+        except oandapy.OandaError as err:
+            if 'Position not found' in str(err):
+                return None
+            else:
+                raise err
+
+    async def get_positions(self, instruments):
+        """ The positions of instruments, None where there is none, requested concurrently """
+        return await asyncio.gather(*[self.get_position(instrument) for instrument in instruments])
+
+    async def request(self, method, endpoint, params=None):
+        """
+        The decoded json response of an API request
+
+        Raises
+        ------
+        oandapy.OandaError
+            On error responses, like oandapy. Bodies that aren't json give
+            the status as code and the body as message.
+        """
+        url = '{}/{}'.format(self.api_url, endpoint)
+        params = dict((k, v) for k, v in (params or {}).items() if v is not None)
+        if method == 'GET':
+            send = functools.partial(self.session.request, method, url, params=params)
+        else:
+            send = functools.partial(self.session.request, method, url, data=params)
+
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(self._executor, send)
+
+        try:
+            content = json.loads(response.content.decode('utf-8'))
+        except ValueError:
+            if response.status_code < 400:
+                raise
+            # Like the html error pages of proxies
+            content = {'code': response.status_code, 'message': response.text}
+        if response.status_code >= 400:
+            raise oandapy.OandaError(content)
+        return content
+
+
+class SyncOanda(object):
+    """
+    AsyncOanda for synchronous callers: each method runs its coroutine on
+    a private event loop and returns the result, e.g. get_positions still
+    requests all its instruments at once.
+
+    Takes the parameters of AsyncOanda.
+    """
+
+    def __init__(self, id, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncOanda(id, **kwargs)
+        self.id = id
+
+    def close(self):
+        self.client.close()
+        self.loop.close()
+
+    def get_account(self):
+        return self._run(self.client.get_account())
+
+    def create_order(self, *args, **kwargs):
+        return self._run(self.client.create_order(*args, **kwargs))
+
+    def close_position(self, instrument):
+        return self._run(self.client.close_position(instrument))
+
+    def get_history(self, *args, **kwargs):
+        return self._run(self.client.get_history(*args, **kwargs))
+
+    def get_position(self, instrument):
+        return self._run(self.client.get_position(instrument))
+
+    def get_positions(self, instruments):
+        return self._run(self.client.get_positions(instruments))
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
@@ -0,0 +1,195 @@
+"""
+Latency histograms of broker calls, in microseconds.
+
+Each call of a timed method records three phases:
+
+- wall: the whole call
+- serialize: building its parameters and preparing the http request
+- network: sending the request and reading the response
+
+    broker = Oanda(account_id)
+    broker.create_order('EUR_USD', 100)
+    broker.latency.histogram('create_order', 'wall').value_at_percentile(99)
+    broker.latency.to_json('latency.json')
+"""
+import math
+import json
+import time
+import threading
+import functools
+import contextlib
+
+PHASES = ('wall', 'serialize', 'network')
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of integer values with a bounded relative error, laid out
+    like an HDR histogram: values are counted exactly below
+    2 * 10 ** significant_figures, then in buckets of doubling ranges,
+    each split in the same number of linear sub buckets. Values read back
+    are the highest of their sub bucket, within 10 ** -significant_figures
+    of the values recorded.
+
+    Parameters
+    ----------
+    significant_figures : int
+    """
+
+    def __init__(self, significant_figures=2):
+        self.significant_figures = significant_figures
+        self.sub_bucket_bits = int(math.ceil(math.log(2 * 10 ** significant_figures, 2)))
+        self.sub_bucket_count = 2 ** self.sub_bucket_bits
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self.total / float(self.count) if self.count else None
+
+    def value_at_percentile(self, percentile):
+        """ The highest value of the sub bucket holding the percentile, None if empty """
+        if not self.count:
+            return None
+        target = max(int(math.ceil(percentile / 100.0 * self.count)), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        """ The summary and non empty buckets, as [lowest value, count], of the histogram """
+        return {'significant_figures': self.significant_figures,
+                'count': self.count,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean(),
+                'percentiles': dict((str(p), self.value_at_percentile(p)) for p in PERCENTILES),
+                'buckets': [[self._lowest_equivalent(index), self.counts[index]] for index in sorted(self.counts)]}
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        # value >> shift is in [sub_bucket_half_count, sub_bucket_count)
+        return self.sub_bucket_half_count * shift + (value >> shift)
+
+    def _shift(self, index):
+        if index < self.sub_bucket_count:
+            return 0, index
+        shift = index // self.sub_bucket_half_count - 1
+        return shift, index - self.sub_bucket_half_count * shift
+
+    def _lowest_equivalent(self, index):
+        shift, sub_bucket = self._shift(index)
+        return sub_bucket << shift
+
+    def _highest_equivalent(self, index):
+        shift, sub_bucket = self._shift(index)
+        return ((sub_bucket + 1) << shift) - 1
+
+
+class LatencyRecorder(object):
+    """
+    The latency histograms of each method and phase, recorded from any
+    thread.
+    """
+
+    def __init__(self, significant_figures=2):
+        self.significant_figures = significant_figures
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def histogram(self, method, phase='wall'):
+        key = (method, phase)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram(self.significant_figures)
+        return self.histograms[key]
+
+    @contextlib.contextmanager
+    def call(self, method):
+        """ Times a call of method, and the phases timed within it """
+        outer = getattr(self._local, 'phases', None)
+        phases = self._local.phases = {'serialize': 0.0, 'network': 0.0}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases['wall'] = time.perf_counter() - start
+            self._local.phases = outer
+            with self._lock:
+                for phase in PHASES:
+                    self.histogram(method, phase).record(phases[phase] * 1e6)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Adds the time spent within to phase name of the current call, if any """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = getattr(self._local, 'phases', None)
+            if phases is not None:
+                phases[name] += time.perf_counter() - start
+
+    def instrument_session(self, session):
+        """
+        Times the request preparation and sending of a requests.Session.
+        Methods are looked up on its class at each call, which keeps
+        patches of requests.Session, like requests_mock's, working.
+        """
+        for attribute, phase in [('prepare_request', 'serialize'), ('send', 'network')]:
+            setattr(session, attribute, self._timed(session, attribute, phase))
+        return session
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def to_dict(self):
+        """ {method: {phase: histogram dict}}, in microseconds """
+        with self._lock:
+            result = {}
+            for (method, phase), histogram in sorted(self.histograms.items()):
+                result.setdefault(method, {})[phase] = histogram.to_dict()
+            return result
+
+    def to_json(self, path=None):
+        """ The histograms as json, also written to path if given """
+        content = json.dumps({'unit': 'us', 'methods': self.to_dict()}, indent=2, sort_keys=True)
+        if path:
+            with open(path, 'w') as f:
+                f.write(content)
+        return content
+
+    def _timed(self, session, attribute, phase):
+        def wrapper(*args, **kwargs):
+            with self.phase(phase):
+                return getattr(type(session), attribute)(session, *args, **kwargs)
+        return wrapper
+
+
+def timed(method):
+    """ Records the latency of a broker method in the broker's latency recorder """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.latency.call(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
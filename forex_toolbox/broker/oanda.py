@@ -1,7 +1,7 @@
 """ Meta wrapper for oanda apis
 See http://developer.oanda.com/rest-live
 
-TODO: Benchmark latency
+The latency of each call is recorded in Oanda.latency, see latency.py
 """
 import pytest
 import os
@@ -10,6 +10,8 @@ import oandapy
 
 import logging
 
+from .latency import LatencyRecorder, timed
+
 
 class Oanda(oandapy.oandapy.API):
     PRECISION = {'EUR_USD': '%.5f',
@@ -26,12 +28,17 @@ class Oanda(oandapy.oandapy.API):
         self.oanda = oandapy.API(environment=os.getenv("OANDA_ENV", "practice"),
                                  access_token=os.getenv("OANDA_ACCESS_TOKEN", "xxx"))
 
+        self.latency = LatencyRecorder()
+        self.latency.instrument_session(self.oanda.client)
+
+    @timed
     def get_account(self):
         params = {"account_id": self.id}
         response = self.oanda.get_account(**params)
         logging.info("#get_account params=%s response=%s" % (params, response))
         return response
 
+    @timed
     def create_order(self, instrument, amount, order_type='market',
                      price=None, lower_bound=None, upper_bound=None, expiry=None,
                      stop_loss=None, take_profit=None, trailling=None):
@@ -47,48 +54,9 @@ class Oanda(oandapy.oandapy.API):
             Oanda order id string
         """
 
-        if amount < 0:
-            side = "sell"
-        else:
-            side = "buy"
-
-        instrument_string = ""
-        if type(instrument) is str:
-            instrument_string = instrument
-        else:
-            instrument_string = instrument.symbol
-        params = {"account_id": self.id,
-                  "instrument": instrument_string,
-                  "units":      abs(amount),
-                  "side":       side,
-                  "type":       order_type}
-
-
-        if expiry is not None:
-            if type(expiry) is str:
-                expiry_string = expiry
-            else:
-                expiry_string = expiry.strftime("%Y-%m-%dT%H:%M:%S")
-            params["expiry"] = expiry_string
-
-        precision = Oanda.PRECISION[instrument_string]
-        if price and order_type != 'market':
-            params["price"] = precision % price
-
-        if lower_bound:
-            params["lowerBound"] = precision % lower_bound
-
-        if upper_bound:
-            params["upperBound"] = precision % upper_bound
-
-        if stop_loss:
-            params["stopLoss"] = precision % stop_loss
-
-        if take_profit:
-            params["takeProfit"] = precision % take_profit
-
-        if trailling:
-            params["trailingStop"] = trailling
+        with self.latency.phase('serialize'):
+            params = order_params(self.id, instrument, amount, order_type, price, lower_bound, upper_bound,
+                                  expiry, stop_loss, take_profit, trailling)
 
         try:
             response = self.oanda.create_order(**params)
@@ -103,6 +71,7 @@ class Oanda(oandapy.oandapy.API):
             logging.exception(e)
             return None
 
+    @timed
     def close_position(self, instrument):
         try:
             response = self.oanda.close_position(self.id, instrument)
@@ -112,15 +81,18 @@ class Oanda(oandapy.oandapy.API):
             logging.exception(e)
             return None
 
-    def get_history(self, instrument, count=500, resolution="m1", end=None, candleFormat="midpoint"):
-        params = {"instrument": instrument.upper(),
-                  "count": count,
-                  "end": end,
-                  "granularity": resolution.upper(),
-                  "candleFormat": candleFormat}
+    @timed
+    def get_history(self, instrument, count=500, resolution="m1", end=None, candleFormat="midpoint", start=None):
+        """
+        Candles up to end, or from start to end when both are given, count
+        being then ignored.
+        """
+        with self.latency.phase('serialize'):
+            params = history_params(instrument, count, resolution, end, candleFormat, start)
         response = self.oanda.get_history(**params)
         return response["candles"]
 
+    @timed
     def get_position(self, instrument):
         params = {"instrument": instrument.upper(),
                   "account_id": self.id}
@@ -133,3 +105,65 @@ class Oanda(oandapy.oandapy.API):
                 raise err
 
 
+def order_params(account_id, instrument, amount, order_type='market',
+                 price=None, lower_bound=None, upper_bound=None, expiry=None,
+                 stop_loss=None, take_profit=None, trailling=None):
+    """ The parameters of oanda's create order request, see Oanda.create_order """
+    if amount < 0:
+        side = "sell"
+    else:
+        side = "buy"
+
+    instrument_string = ""
+    if type(instrument) is str:
+        instrument_string = instrument
+    else:
+        instrument_string = instrument.symbol
+    params = {"account_id": account_id,
+              "instrument": instrument_string,
+              "units":      abs(amount),
+              "side":       side,
+              "type":       order_type}
+
+
+    if expiry is not None:
+        if type(expiry) is str:
+            expiry_string = expiry
+        else:
+            expiry_string = expiry.strftime("%Y-%m-%dT%H:%M:%S")
+        params["expiry"] = expiry_string
+
+    precision = Oanda.PRECISION[instrument_string]
+    if price and order_type != 'market':
+        params["price"] = precision % price
+
+    if lower_bound:
+        params["lowerBound"] = precision % lower_bound
+
+    if upper_bound:
+        params["upperBound"] = precision % upper_bound
+
+    if stop_loss:
+        params["stopLoss"] = precision % stop_loss
+
+    if take_profit:
+        params["takeProfit"] = precision % take_profit
+
+    if trailling:
+        params["trailingStop"] = trailling
+
+    return params
+
+
+def history_params(instrument, count=500, resolution="m1", end=None, candleFormat="midpoint", start=None):
+    """ The parameters of oanda's candles request, see Oanda.get_history """
+    params = {"instrument": instrument.upper(),
+              "count": count,
+              "end": end,
+              "granularity": resolution.upper(),
+              "candleFormat": candleFormat}
+    if start is not None:
+        params["start"] = start
+        if end is not None:
+            del params["count"]
+    return params
@@ -21,6 +21,8 @@ from zipline.finance.commission import PerShare
 class SimuBroker(object):
     def __init__(self, algo, reader=None):
         self.algo = algo
+        # Whole history of the sids read by get_history, as stored
+        self._bars = {}
         if self.algo is not None:
             if reader is None:
                 self._reader = self.algo.data_portal.minute_reader
@@ -79,12 +81,12 @@ class SimuBroker(object):
         """
         sid = instr.sid
         if conserve_mem:
-            self.sql_reader.load_data_cache([sid], start=start_dt, end=end_dt)
+            cache = self.sql_reader.read_bars(sid, start=start_dt, end=end_dt)
         else:
-            if not hasattr(self.sql_reader, '_cache') or sid not in self.sql_reader._cache:
-                self.sql_reader.load_data_cache([sid])
+            if sid not in self._bars:
+                self._bars[sid] = self.sql_reader.read_bars(sid)
+            cache = self._bars[sid]
 
-        cache = self.sql_reader._cache[instr.sid]
         if end_dt not in cache.index and not fuzzy:
             return None
 
@@ -96,7 +98,6 @@ class SimuBroker(object):
             start_index = end_index - count * (time_delta(resolution)/timedelta(minutes=1))
             start_index = int(start_index)
         elif start_dt:
-            cache = self.sql_reader._cache[instr.sid]
             while start_dt not in cache.index:
                 if conserve_mem:
                     start_dt = start_dt + time_delta(resolution)
@@ -104,7 +105,7 @@ class SimuBroker(object):
                     start_dt = start_dt - time_delta(resolution)
             start_index = cache.index.get_loc(start_dt)
 
-        df = self.sql_reader._cache[instr.sid][start_index:end_index]
+        df = cache[start_index:end_index]
         df = df.resample(oanda_to_pandas(resolution)).agg({'open': 'first',
                                                            'high': 'max',
                                                            'low': 'min',
@@ -0,0 +1,170 @@
+import json
+import time
+import asyncio
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import oandapy
+import requests_mock
+import pytest
+
+from .async_oanda import AsyncOanda, SyncOanda
+
+API_URL = "https://api-fxpractice.oanda.com/v1/accounts/test"
+
+
+class PositionServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 64
+
+
+@pytest.fixture
+def server():
+    """ Oanda's positions endpoint, answering after delay seconds """
+    server = None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with server.lock:
+                server.in_flight += 1
+                server.most_in_flight = max(server.most_in_flight, server.in_flight)
+            time.sleep(server.delay)
+            with server.lock:
+                server.in_flight -= 1
+
+            instrument = self.path.split('/')[-1]
+            if instrument == 'INSTRUMENT_3':
+                self.reply(400, {"code": 14, "message": "Position not found"})
+            else:
+                self.reply(200, position(instrument))
+
+        def reply(self, status, body):
+            body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = PositionServer(('127.0.0.1', 0), Handler)
+    server.delay = 0.1
+    server.lock = threading.Lock()
+    server.in_flight = 0
+    server.most_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def broker():
+    broker = SyncOanda("test", concurrency=40, environment="practice")
+    yield broker
+    broker.close()
+
+
+def local_broker(server, concurrency):
+    broker = SyncOanda("test", concurrency=concurrency)
+    broker.client.api_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    return broker
+
+
+def position(instrument):
+    return {"instrument": instrument, "units": 10, "side": "buy", "avgPrice": 1.1}
+
+
+def test_get_positions_concurrently(server):
+    broker = local_broker(server, concurrency=40)
+    instruments = ['INSTRUMENT_{}'.format(i) for i in range(40)]
+
+    start = time.time()
+    positions = broker.get_positions(instruments)
+    elapsed = time.time() - start
+    broker.close()
+
+    assert elapsed < server.delay * 10
+    assert positions[3] is None
+    assert [p["instrument"] for i, p in enumerate(positions) if i != 3] == \
+        [instrument for i, instrument in enumerate(instruments) if i != 3]
+
+
+def test_concurrency_limit(server):
+    server.delay = 0.02
+    broker = local_broker(server, concurrency=2)
+    broker.get_positions(['EUR_USD'] * 8)
+    broker.close()
+    assert server.most_in_flight == 2
+
+
+def test_create_order_sell_market(broker):
+    with requests_mock.mock() as m:
+        m.post("{}/orders".format(API_URL),
+               json={"instrument": "EUR_USD", "price": 1.37041, "tradeOpened": {"id": 175517237}})
+
+        assert broker.create_order("EUR_USD", -2) == 175517237
+        expected_params = ['instrument=EUR_USD', 'side=sell', 'type=market', 'units=2']
+        assert set(m.request_history[0].text.split("&")) == set(expected_params)
+
+
+def test_errors(broker):
+    error = {"code": 1, "message": "Insufficient authorization to perform request"}
+    with requests_mock.mock() as m:
+        m.post("{}/orders".format(API_URL), status_code=401, json=error)
+        m.delete("{}/positions/EUR_USD".format(API_URL), status_code=401, json=error)
+        m.get("{}/positions/EUR_USD".format(API_URL), status_code=401, json=error)
+
+        assert broker.create_order("EUR_USD", 2) is None
+        assert broker.close_position("EUR_USD") is None
+        with pytest.raises(Exception):
+            broker.get_position("EUR_USD")
+
+
+def test_error_pages_raise_oanda_errors(broker):
+    with requests_mock.mock() as m:
+        m.get("{}/positions/EUR_USD".format(API_URL), status_code=502,
+              text="<html><body>502 Bad Gateway</body></html>")
+
+        with pytest.raises(oandapy.OandaError) as err:
+            broker.get_position("EUR_USD")
+        assert '502' in str(err.value) and 'Bad Gateway' in str(err.value)
+
+
+def test_client_runs_on_successive_event_loops():
+    client = AsyncOanda("test", concurrency=2)
+    with requests_mock.mock() as m:
+        m.get("{}/positions/EUR_USD".format(API_URL), json=position("EUR_USD"))
+        for _ in range(2):
+            loop = asyncio.new_event_loop()
+            positions = loop.run_until_complete(client.get_positions(["EUR_USD"] * 3))
+            loop.close()
+            assert [p["instrument"] for p in positions] == ["EUR_USD"] * 3
+    client.close()
+
+
+def test_get_history_and_account_from_a_coroutine():
+    client = AsyncOanda("test")
+
+    async def requests():
+        return await asyncio.gather(client.get_account(),
+                                    client.get_history("eur_usd", start="2016-09-01T00:00:00Z",
+                                                       end="2016-09-01T00:01:00Z"))
+
+    with requests_mock.mock() as m:
+        m.get(API_URL, json={"accountId": "test", "balance": 100})
+        m.get("https://api-fxpractice.oanda.com/v1/candles", json={"candles": [{"time": "2016-09-01T00:00:00Z"}]})
+        loop = asyncio.new_event_loop()
+        account, candles = loop.run_until_complete(requests())
+        loop.close()
+
+    client.close()
+    assert account["balance"] == 100
+    assert candles == [{"time": "2016-09-01T00:00:00Z"}]
+    query = [r for r in m.request_history if 'candles' in r.path][0].qs
+    assert query['instrument'] == ['eur_usd']
+    assert 'count' not in query
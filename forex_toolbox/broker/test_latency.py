@@ -0,0 +1,89 @@
+import json
+import threading
+import pytest
+
+from .latency import LatencyHistogram, LatencyRecorder, timed
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 100001):
+        histogram.record(value)
+
+    assert histogram.count == 100000
+    assert (histogram.min, histogram.max) == (1, 100000)
+    assert histogram.mean() == 50000.5
+    for percentile in [1, 50, 90, 99, 99.9]:
+        exact = percentile * 1000
+        assert exact <= histogram.value_at_percentile(percentile) <= exact * 1.01
+    assert histogram.value_at_percentile(100) == 100000
+
+
+@pytest.mark.parametrize("significant_figures", [1, 2, 3])
+def test_histogram_relative_error(significant_figures):
+    for value in [0, 1, 199, 200, 2047, 2048, 123456, 10 ** 8, 3 * 10 ** 9]:
+        histogram = LatencyHistogram(significant_figures)
+        histogram.record(value)
+        histogram.record(10 ** 10)
+        read = histogram.value_at_percentile(50)
+        assert value <= read <= value * (1 + 10 ** -significant_figures)
+
+
+def test_histogram_to_dict():
+    histogram = LatencyHistogram()
+    assert histogram.to_dict()['percentiles']['50'] is None
+    histogram.record(5, count=3)
+    histogram.record(1000)
+
+    result = histogram.to_dict()
+    assert result['count'] == 4
+    assert result['percentiles'] == {'50': 5, '90': 1000, '99': 1000, '99.9': 1000}
+    assert result['buckets'] == [[5, 3], [1000, 1]]
+
+
+class Broker(object):
+    def __init__(self):
+        self.latency = LatencyRecorder()
+
+    @timed
+    def order(self, fail=False):
+        with self.latency.phase('serialize'):
+            pass
+        with self.latency.phase('network'):
+            if fail:
+                raise ValueError(fail)
+        return 'ok'
+
+
+def test_recorder_records_each_phase_from_threads():
+    broker = Broker()
+    threads = [threading.Thread(target=lambda: [broker.order() for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with pytest.raises(ValueError):
+        broker.order(fail=True)
+
+    # Outside of a timed call, phases are not recorded
+    with broker.latency.phase('network'):
+        pass
+
+    result = broker.latency.to_dict()
+    assert list(result) == ['order']
+    assert dict((phase, h['count']) for phase, h in result['order'].items()) == \
+        {'wall': 401, 'serialize': 401, 'network': 401}
+
+
+def test_recorder_to_json(tmpdir):
+    broker = Broker()
+    broker.order()
+    path = str(tmpdir.join('latency.json'))
+    content = broker.latency.to_json(path)
+
+    with open(path) as f:
+        assert json.load(f) == json.loads(content)
+    assert json.loads(content)['methods']['order']['wall']['count'] == 1
+
+    broker.latency.reset()
+    assert broker.latency.to_dict() == {}
@@ -1,3 +1,5 @@
+import json
+import time
 import requests_mock
 import pytest
 import os
@@ -98,3 +100,30 @@ def test_create_order_stop(broker, asset):
                            'type=stop', 'units=2',
                            'price=2.34560']
         assert set(call[0].text.split("&")) == set(expected_params)
+
+
+def test_latency_is_recorded(broker, asset):
+    def slow_order(request, context):
+        time.sleep(0.01)
+        return order_response()
+
+    with requests_mock.mock() as m:
+        m.post("https://api-fxpractice.oanda.com/v1/accounts/{0}/orders".format(broker.id),
+               json=slow_order)
+        m.get("https://api-fxpractice.oanda.com/v1/accounts/{0}/positions/EUR_USD".format(broker.id),
+              status_code=400, json={"code": 14, "message": "Position not found"})
+
+        for _ in range(3):
+            broker.create_order(asset, -2)
+        assert broker.get_position("EUR_USD") is None
+
+    latency = json.loads(broker.latency.to_json())
+    assert latency['unit'] == 'us'
+    assert sorted(latency['methods']) == ['create_order', 'get_position']
+
+    order = latency['methods']['create_order']
+    assert [order[phase]['count'] for phase in ['wall', 'serialize', 'network']] == [3, 3, 3]
+    assert order['network']['min'] >= 10000
+    assert order['wall']['min'] >= order['network']['min']
+    assert 0 < order['serialize']['max'] < order['wall']['min']
+    assert latency['methods']['get_position']['wall']['count'] == 1
@@ -1,2 +1,4 @@
 from .oanda_minute_price_ingest import OandaMinutePriceIngest
 from .sql_data_portal import SqlDataPortal, SqlMinuteReader
+from .memmap_bars import MemmapMinuteBarReader, MemmapMinuteBarWriter
+from .sql_bar_writer import SqlMinuteBarWriter
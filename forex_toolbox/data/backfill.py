@@ -0,0 +1,256 @@
+"""
+Concurrent backfills of minute bar history. A job of symbols over a date
+range is cut in page sized time slices, fetched by a pool of threads under
+a rate limit, while a writer thread writes the pages as they come. Written
+slices are recorded in a json checkpoint, so a restarted job only fetches
+the others.
+
+Workers share the ingest, and so OandaMinutePriceIngest's single oandapy
+client and its requests.Session. That is safe for these requests: the
+session's headers are set once by oandapy, oanda sets no cookies, and
+connections are checked out of urllib3's thread safe pool, which keeps
+up to 10 of them per host, more than DEFAULT_WORKERS.
+
+    ingest = OandaMinutePriceIngest(db_url)
+    Backfill(ingest, ['EUR_USD', 'USD_JPY'], '2010-01-01', '2017-01-01',
+             checkpoint='backfill.json').run()
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+# Minutes per slice: oanda returns 500 candles per page by default
+SLICE_MINUTES = 500
+
+DEFAULT_WORKERS = 4
+
+# Requests per second, shared by all workers
+DEFAULT_RATE = 10
+
+log = logging.getLogger(__name__)
+
+
+def time_slices(start, end, minutes=SLICE_MINUTES):
+    """
+    Returns
+    -------
+    list of (pd.Timestamp, pd.Timestamp)
+        Consecutive slices of at most minutes, from start included to end
+        excluded, UTC
+    """
+    start, end = _utc(start), _utc(end)
+    bounds = list(pd.date_range(start, end, freq='{}min'.format(minutes)))
+    if not bounds or bounds[-1] < end:
+        bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class RateLimiter(object):
+    """
+    Spaces calls to acquire at rate per second, across threads, letting
+    bursts of up to burst calls through after idle time.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        now = time.time()
+        with self._lock:
+            slot = max(self._next, now - (self.burst - 1) / self.rate)
+            self._next = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint(object):
+    """
+    The slices of each symbol already written, by start, kept in a json
+    file. It is saved at most every save_interval seconds, and by save:
+    slices written since the last save are fetched again after a restart,
+    which is harmless as bars are upserted.
+
+    Parameters
+    ----------
+    path : str or None
+        None keeps the checkpoint in memory only
+    save_interval : float
+    """
+
+    def __init__(self, path=None, save_interval=1.0):
+        self.path = path
+        self.save_interval = save_interval
+        self._done = {}
+        self._saved = time.time()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._done = dict((symbol, set(starts)) for symbol, starts in json.load(f)['done'].items())
+
+    def done(self, symbol, start):
+        return _utc(start).value in self._done.get(symbol, ())
+
+    def mark(self, symbol, start):
+        self._done.setdefault(symbol, set()).add(_utc(start).value)
+        if time.time() - self._saved >= self.save_interval:
+            self.save()
+
+    def save(self):
+        self._saved = time.time()
+        if not self.path:
+            return
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'done': dict((symbol, sorted(starts)) for symbol, starts in self._done.items())}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class Backfill(object):
+    """
+    Fetches and writes the bars of symbols from start to end.
+
+    Parameters
+    ----------
+    ingest : OandaMinutePriceIngest
+        Or any object with fetch(symbol, start, end) returning bars indexed
+        by minute, write(symbol, bars), and flush() called once written
+    symbols : list of str
+    start, end : str or pd.Timestamp
+        UTC, end excluded
+    workers : int
+        Concurrent fetches
+    rate : float
+        Fetches per second
+    checkpoint : str or Checkpoint
+        Path of the json checkpoint, or None to start from scratch
+    slice_minutes : int
+    retries : int
+        Attempts per slice after a failed fetch, waiting backoff seconds,
+        doubled after each attempt
+    backoff : float
+    max_pages : int
+        Fetched pages waiting to be written, workers wait beyond it
+    """
+
+    def __init__(self, ingest, symbols, start, end, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+                 checkpoint=None, slice_minutes=SLICE_MINUTES, retries=3, backoff=1.0, max_pages=64):
+        self.ingest = ingest
+        self.symbols = list(symbols)
+        self.start, self.end = _utc(start), _utc(end)
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate, burst=workers)
+        if not isinstance(checkpoint, Checkpoint):
+            checkpoint = Checkpoint(checkpoint)
+        self.checkpoint = checkpoint
+        self.slice_minutes = slice_minutes
+        self.retries = retries
+        self.backoff = backoff
+        self.max_pages = max_pages
+
+    def slices(self):
+        """ The (symbol, start, end) slices left to write """
+        return [(symbol, start, end)
+                for start, end in time_slices(self.start, self.end, self.slice_minutes)
+                for symbol in self.symbols
+                if not self.checkpoint.done(symbol, start)]
+
+    def run(self):
+        """
+        Returns
+        -------
+        int
+            Number of slices written
+
+        Raises
+        ------
+        Exception
+            The first fetch, after retries, or write that failed. Fetches
+            not started yet are cancelled, and slices written until then
+            are checkpointed, as on KeyboardInterrupt.
+        """
+        slices = self.slices()
+        self._pages = queue.Queue(maxsize=self.max_pages)
+        self._stop = threading.Event()
+        self._errors = []
+        self._written = 0
+
+        writer = threading.Thread(target=self._write_pages, name='backfill-writer')
+        writer.start()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = [executor.submit(self._fetch, *s) for s in slices]
+        try:
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    self._fail(error)
+                    break
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self._pages.put(None)
+            writer.join()
+            self.checkpoint.save()
+
+        if self._errors:
+            raise self._errors[0]
+        return self._written
+
+    def _fetch(self, symbol, start, end):
+        if self._stop.is_set():
+            return
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                bars = self.ingest.fetch(symbol, start=start, end=end)
+                break
+            except Exception as err:
+                if attempt == self.retries or self._stop.is_set():
+                    # Other workers skip their slices from now on
+                    self._stop.set()
+                    raise
+                log.warning('Fetching %s from %s failed, retrying: %s', symbol, start, err)
+                time.sleep(self.backoff * 2 ** attempt)
+
+        # Slices share their bounds, the last minute is the next slice's
+        minutes = bars.index.values.astype('datetime64[ns]').view(np.int64)
+        self._pages.put((symbol, start, bars[minutes < end.value]))
+
+    def _write_pages(self):
+        while True:
+            page = self._pages.get()
+            if page is None:
+                try:
+                    self.ingest.flush()
+                except Exception as err:
+                    self._fail(err)
+                return
+            if self._stop.is_set():
+                continue
+            symbol, start, bars = page
+            try:
+                if len(bars):
+                    self.ingest.write(symbol, bars)
+                self.checkpoint.mark(symbol, start)
+                self._written += 1
+            except Exception as err:
+                self._fail(err)
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+
+def _utc(dt):
+    dt = pd.Timestamp(dt)
+    return dt.tz_localize('UTC') if dt.tzinfo is None else dt.tz_convert('UTC')
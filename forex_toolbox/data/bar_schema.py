@@ -0,0 +1,229 @@
+"""
+Schema of the minute_bars_<SYMBOL> tables, and its migrations.
+
+Version 0 keyed bars by a datetime column, a DateTime when created by
+OandaMinutePriceIngest but declared String(30) by SqlMinuteReader, so
+range queries compared strings and dates were parsed client side.
+Version 1 keys them by ts, int64 nanoseconds since the epoch, UTC: range
+queries bind plain integers and use the primary key index.
+
+Existing tables are migrated in place with
+
+    python -m forex_toolbox.data.bar_schema DATABASE_URL [SYMBOL ...]
+
+Alternatively to one table per instrument, the 'shared' layout keeps all
+bars in one minute_bars table keyed by (sid, ts), so that one query reads
+many instruments. On PostgreSQL it is partitioned by month of ts, the
+partitions being created as bars are written.
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    create_engine,
+    inspect,
+    select,
+    Table,
+    MetaData,
+    Column,
+    BigInteger,
+    Integer,
+    String,
+)
+from sqlalchemy.schema import CreateTable
+
+SCHEMA_VERSION = 1
+
+TABLE_PREFIX = 'minute_bars_'
+
+VERSIONS_TABLE = 'minute_bar_schema'
+
+LAYOUTS = ('per_symbol', 'shared')
+
+SHARED_TABLE = 'minute_bars'
+
+PARTITION_PREFIX = 'minute_bar_partition_'
+
+# ts of version 0 datetime columns, stored as naive UTC
+EPOCH_NS = {
+    'postgresql': 'CAST(ROUND(EXTRACT(EPOCH FROM CAST(datetime AS TIMESTAMP)) * 1000000000) AS BIGINT)',
+    'sqlite': "CAST(strftime('%s', datetime) AS INTEGER) * 1000000000",
+}
+
+
+def bar_table(symbol, metadata=None, name=None):
+    metadata = metadata or MetaData()
+    return Table(name or TABLE_PREFIX + symbol, metadata,
+                 Column('ts', BigInteger, primary_key=True, autoincrement=False),
+                 Column('open', Integer, nullable=False),
+                 Column('high', Integer, nullable=False),
+                 Column('low', Integer, nullable=False),
+                 Column('close', Integer, nullable=False),
+                 Column('volume', Integer, nullable=False))
+
+
+def shared_bar_table(metadata=None):
+    metadata = metadata or MetaData()
+    return Table(SHARED_TABLE, metadata,
+                 Column('sid', Integer, primary_key=True, autoincrement=False),
+                 Column('ts', BigInteger, primary_key=True, autoincrement=False),
+                 Column('open', Integer, nullable=False),
+                 Column('high', Integer, nullable=False),
+                 Column('low', Integer, nullable=False),
+                 Column('close', Integer, nullable=False),
+                 Column('volume', Integer, nullable=False))
+
+
+def versions_table(metadata=None):
+    metadata = metadata or MetaData()
+    return Table(VERSIONS_TABLE, metadata,
+                 Column('table_name', String(64), primary_key=True),
+                 Column('version', Integer, nullable=False))
+
+
+def to_ts(dt):
+    """ dt as int64 nanoseconds since the epoch, UTC, naive dts being UTC """
+    return int(pd.Timestamp(dt).value)
+
+
+def ts_index(ts):
+    """ The naive UTC DatetimeIndex of ts values, as readers index bars """
+    return pd.DatetimeIndex(np.asarray(ts, dtype=np.int64).astype('datetime64[ns]'), name='datetime')
+
+
+def table_version(engine, symbol):
+    """
+    Returns
+    -------
+    int or None
+        Schema version of the bar table of symbol, None if it doesn't exist
+    """
+    name = TABLE_PREFIX + symbol
+    inspector = inspect(engine)
+    if name not in inspector.get_table_names():
+        return None
+    columns = set(column['name'] for column in inspector.get_columns(name))
+    if 'ts' not in columns:
+        return 0
+    if VERSIONS_TABLE not in inspector.get_table_names():
+        return SCHEMA_VERSION
+    versions = versions_table()
+    version = engine.execute(select([versions.c.version])
+                             .where(versions.c.table_name == name)).scalar()
+    return SCHEMA_VERSION if version is None else version
+
+
+def ensure_table(engine, symbol):
+    """
+    Creates the bar table of symbol if missing.
+
+    Raises
+    ------
+    ValueError
+        If the table exists at an older schema version, see migrate
+    """
+    version = table_version(engine, symbol)
+    if version is None:
+        with engine.begin() as conn:
+            bar_table(symbol).create(conn)
+            _record_version(conn, TABLE_PREFIX + symbol)
+    elif version < SCHEMA_VERSION:
+        raise ValueError('{}{} is at schema version {}, migrate it with '
+                         'python -m forex_toolbox.data.bar_schema'.format(TABLE_PREFIX, symbol, version))
+
+
+def ensure_shared_table(engine):
+    """ Creates the minute_bars table of the shared layout if missing """
+    if SHARED_TABLE in inspect(engine).get_table_names():
+        return
+    table = shared_bar_table()
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(str(CreateTable(table).compile(dialect=engine.dialect)).rstrip() +
+                         ' PARTITION BY RANGE (ts)')
+        else:
+            table.create(conn)
+        _record_version(conn, SHARED_TABLE)
+
+
+def ensure_partitions(engine, start, end):
+    """
+    Creates the monthly partitions of the minute_bars table holding the
+    minutes from start to end, on PostgreSQL. Other databases don't
+    partition it, the (sid, ts) primary key index is all there is.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    month = pd.Timestamp(to_ts(start)).normalize().replace(day=1)
+    with engine.begin() as conn:
+        while month.value <= to_ts(end):
+            next_month = month + pd.DateOffset(months=1)
+            conn.execute('CREATE TABLE IF NOT EXISTS "{}{}" PARTITION OF "{}" FOR VALUES FROM ({}) TO ({})'
+                         .format(PARTITION_PREFIX, month.strftime('%Y%m'), SHARED_TABLE,
+                                 month.value, next_month.value))
+            month = next_month
+
+
+def migrate(engine, symbol):
+    """
+    Converts the bar table of symbol to the current schema version, in one
+    transaction: bars are copied to a new table by the database itself,
+    then the new table replaces the old one.
+
+    Returns
+    -------
+    int or None
+        The version the table was at, None if it doesn't exist
+    """
+    version = table_version(engine, symbol)
+    if version is None or version >= SCHEMA_VERSION:
+        return version
+    if engine.dialect.name not in EPOCH_NS:
+        raise ValueError('Migrating bar tables is not supported on {}'.format(engine.dialect.name))
+
+    name = TABLE_PREFIX + symbol
+    new_name = name + '_v{}'.format(SCHEMA_VERSION)
+    with engine.begin() as conn:
+        bar_table(symbol, name=new_name).create(conn)
+        conn.execute('INSERT INTO "{}" (ts, open, high, low, close, volume) '
+                     'SELECT {}, open, high, low, close, volume FROM "{}"'
+                     .format(new_name, EPOCH_NS[engine.dialect.name], name))
+        conn.execute('DROP TABLE "{}"'.format(name))
+        conn.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(new_name, name))
+        _record_version(conn, name)
+    return version
+
+
+def bar_symbols(engine):
+    """ Symbols having a bar table """
+    return sorted(name[len(TABLE_PREFIX):] for name in inspect(engine).get_table_names()
+                  if name.startswith(TABLE_PREFIX))
+
+
+def _record_version(conn, name):
+    versions = versions_table()
+    versions.create(conn, checkfirst=True)
+    conn.execute(versions.delete().where(versions.c.table_name == name))
+    conn.execute(versions.insert(), table_name=name, version=SCHEMA_VERSION)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrates minute bar tables to schema version {}'
+                                     .format(SCHEMA_VERSION))
+    parser.add_argument('db_url')
+    parser.add_argument('symbols', nargs='*', help='defaults to every minute_bars_<SYMBOL> table')
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url)
+    for symbol in args.symbols or bar_symbols(engine):
+        version = migrate(engine, symbol)
+        if version is None:
+            print('{}{}: no such table'.format(TABLE_PREFIX, symbol))
+        elif version < SCHEMA_VERSION:
+            print('{}{}: migrated from version {}'.format(TABLE_PREFIX, symbol, version))
+        else:
+            print('{}{}: up to date'.format(TABLE_PREFIX, symbol))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+An LRU cache of fixed-size time blocks of minute bars, for readers that
+load history lazily instead of all at once.
+"""
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+
+DEFAULT_BLOCK_SIZE = pd.Timedelta(weeks=1)
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+class BlockCache(object):
+    """
+    Splits time into blocks of block_size since the epoch, and loads the
+    bars of a sid one block at a time, on demand, keeping the most recently
+    used blocks until they take more than memory_budget bytes.
+
+    As a backtest moves forward, each block read also schedules the next
+    one of the same sid to be loaded by a background thread.
+
+    Parameters
+    ----------
+    load : callable
+        load(sid, start, end) returns the bars of sid from start included
+        to end excluded, naive UTC Timestamps, as a DataFrame indexed by
+        minute or any object with an nbytes size
+    block_size : pd.Timedelta
+    memory_budget : int
+        In bytes. The block being read is kept even if larger.
+    prefetch : bool
+    """
+
+    def __init__(self, load, block_size=DEFAULT_BLOCK_SIZE, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 prefetch=True):
+        self._load = load
+        self.block_size = pd.Timedelta(block_size)
+        self.memory_budget = memory_budget
+        self.nbytes = 0
+
+        self._blocks = collections.OrderedDict()
+        self._sizes = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+    def block_number(self, dt):
+        return pd.Timestamp(dt).value // self.block_size.value
+
+    def block_bounds(self, number):
+        start = pd.Timestamp(number * self.block_size.value)
+        return start, start + self.block_size
+
+    def get(self, sid, dt):
+        """ The block of sid holding minute dt """
+        return self.block(sid, self.block_number(dt))
+
+    def block(self, sid, number):
+        key = (sid, number)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+            future = self._pending.get(key)
+
+        if block is None:
+            block = future.result() if future is not None else self._fetch(key)
+        self._prefetch((sid, number + 1))
+        return block
+
+    def blocks(self, sid, start, end):
+        """ The blocks of sid holding the minutes from start to end, both included """
+        numbers = range(self.block_number(start), self.block_number(end) + 1)
+        return [self.block(sid, number) for number in numbers]
+
+    def close(self):
+        """ Stops the prefetch thread, blocks are then only loaded when read """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _prefetch(self, key):
+        if self._executor is None:
+            return
+        with self._lock:
+            if key in self._blocks or key in self._pending:
+                return
+            self._pending[key] = self._executor.submit(self._fetch, key)
+
+    def _fetch(self, key):
+        sid, number = key
+        start, end = self.block_bounds(number)
+        try:
+            block = self._load(sid, start, end)
+        except Exception:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+
+        size = _nbytes(block)
+        with self._lock:
+            if key in self._blocks:
+                self.nbytes -= self._sizes[key]
+            self._blocks[key] = block
+            self._blocks.move_to_end(key)
+            self._sizes[key] = size
+            self.nbytes += size
+            self._pending.pop(key, None)
+            while self.nbytes > self.memory_budget and len(self._blocks) > 1:
+                evicted, _ = self._blocks.popitem(last=False)
+                self.nbytes -= self._sizes.pop(evicted)
+        return block
+
+
+def _nbytes(block):
+    if hasattr(block, 'nbytes'):
+        return int(block.nbytes)
+    return int(block.memory_usage(index=True).sum())
@@ -0,0 +1,297 @@
+"""
+A columnar, memory mapped store of minute bars, as an alternative to the
+minute_bars_<SYMBOL> sql tables. Each instrument gets a folder with one
+flat array file per column, and a json file recording how many bars they
+hold:
+
+    <root>/EUR_USD/meta.json
+                   datetime.i8     int64 ns since epoch, UTC, increasing
+                   open.i4         int32 prices, see convert_price_to_int
+                   high.i4
+                   low.i4
+                   close.i4
+                   volume.i8       int64
+
+Readers map the files with np.memmap, so opening years of history is
+instant and costs no memory until the bars are read.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from .. import utils
+from .sql_data_portal import VOLUME_MULTIPLIER
+
+from zipline.utils.calendars import get_calendar
+from zipline.data.minute_bars import MinuteBarReader
+
+
+COLUMNS = [('datetime', np.int64), ('open', np.int32), ('high', np.int32),
+           ('low', np.int32), ('close', np.int32), ('volume', np.int64)]
+
+META_FILENAME = 'meta.json'
+
+VERSION = 1
+
+
+def column_path(folder, name, dtype):
+    return os.path.join(folder, '{}.{}{}'.format(name, np.dtype(dtype).kind, np.dtype(dtype).itemsize))
+
+
+class MemmapMinuteBarWriter(object):
+    """
+    Writes minute bars to a memmap store.
+
+    Parameters
+    ----------
+    rootdir : str
+        Created if missing
+    """
+
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+
+    def write(self, symbol, df):
+        """
+        Writes the bars of an instrument, replacing stored bars of the same
+        minute. Bars starting within the stored range only rewrite the
+        stored bars from their first minute on, which are merged with them
+        then appended in place. Only bars starting before the stored range
+        rewrite the whole instrument.
+
+        Parameters
+        ----------
+        symbol : str
+        df : pd.DataFrame
+            Integer open, high, low, close and volume columns, indexed by
+            minute, naive UTC or tz aware
+        """
+        folder = os.path.join(self.rootdir, symbol)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        if not len(df):
+            return
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        columns = {'datetime': df.index.values.astype('datetime64[ns]').view(np.int64)}
+        for name, dtype in COLUMNS[1:]:
+            columns[name] = _checked_cast(df[name].values, dtype, name)
+
+        length = _read_meta(folder)['length']
+        if length:
+            stored = _open_columns(folder, length)
+            if stored['datetime'][0] > columns['datetime'][0]:
+                columns = _merge(stored, columns)
+                del stored
+                self._rewrite(folder, columns)
+                return
+            position = int(np.searchsorted(stored['datetime'], columns['datetime'][0]))
+            if position < length:
+                tail = dict((name, np.array(stored[name][position:])) for name, _ in COLUMNS)
+                columns = _merge(tail, columns)
+                # The bars from position on are rewritten, they stop counting first
+                _write_meta(folder, position)
+                length = position
+            del stored
+
+        for name, dtype in COLUMNS:
+            with open(column_path(folder, name, dtype), 'ab') as f:
+                f.truncate(length * np.dtype(dtype).itemsize)
+                f.write(columns[name].tobytes())
+        # Recorded last, the new bars only count once all columns have them
+        _write_meta(folder, length + len(columns['datetime']))
+
+    def _rewrite(self, folder, columns):
+        _write_meta(folder, 0)
+        for name, dtype in COLUMNS:
+            path = column_path(folder, name, dtype)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(columns[name].tobytes())
+            os.replace(path + '.tmp', path)
+        _write_meta(folder, len(columns['datetime']))
+
+
+class MemmapMinuteBarReader(MinuteBarReader):
+    """
+    Reads minute bars written by MemmapMinuteBarWriter, like
+    SqlMinuteReader reads the sql tables, with prices scaled back to
+    floats and volumes by VOLUME_MULTIPLIER.
+
+    Parameters
+    ----------
+    rootdir : str
+    trading_calendar : TradingCalendar
+        Defaults to NYSE, like SqlMinuteReader
+    """
+
+    def __init__(self, rootdir, trading_calendar=None):
+        self.rootdir = rootdir
+        self.trading_calendar = trading_calendar or get_calendar("NYSE")
+        self._sids = None
+        self._columns = {}
+
+    def load_data_cache(self, sids, start=None, end=None):
+        """
+        Nothing is loaded, the bars are read from the mapped files when
+        used. Only remembers sids, for days_of_data.
+        """
+        self._sids = list(sids)
+
+    def columns(self, sid):
+        """
+        Returns
+        -------
+        dict of str to np.memmap
+            Every column of the instrument, read only. Empty arrays when it
+            has no bars. The files are mapped again once a writer changed
+            them, so bars written meanwhile are seen.
+        """
+        folder = os.path.join(self.rootdir, utils.symbol(sid))
+        version = _files_version(folder)
+        if sid not in self._columns or self._columns[sid][0] != version:
+            self._columns[sid] = (version, _open_columns(folder, _read_meta(folder)['length']))
+        return self._columns[sid][1]
+
+    @property
+    def days_of_data(self):
+        sids = self._sids or sorted(utils.sid(symbol) for symbol in os.listdir(self.rootdir))
+        return pd.DatetimeIndex(self.columns(sids[0])['datetime'])
+
+    @property
+    def last_available_dt(self):
+        s = self.days_of_data[-1].tz_localize("UTC") \
+                .replace(hour=0, minute=0)
+        (_, close) = self.trading_calendar.open_and_close_for_session(s)
+        return close
+
+    @property
+    def first_trading_day(self):
+        return self.days_of_data[0]
+
+    def get_last_traded_dt(self, asset, dt):
+        datetimes = self.columns(asset.sid)['datetime']
+        position = np.searchsorted(datetimes, pd.Timestamp(dt).value, side='right') - 1
+        if position < 0:
+            return pd.NaT
+        return pd.Timestamp(datetimes[position], tz='UTC')
+
+    def get_value(self, sid, dt, field):
+        if field == 'price':
+            field = 'close'
+        columns = self.columns(sid)
+        datetimes = columns['datetime']
+        minute = pd.Timestamp(dt).value
+        position = np.searchsorted(datetimes, minute)
+        if position == len(datetimes) or datetimes[position] != minute:
+            if field == 'volume':
+                return 0
+            else:
+                return np.nan
+        val = columns[field][position]
+        if field == 'volume':
+            return int(val) * VOLUME_MULTIPLIER
+        else:
+            return int(val) * utils.float_multiplier(sid)
+
+    def load_raw_arrays(self, fields, start_dt, end_dt, sids):
+        """
+        Parameters
+        ----------
+        fields : list of str
+           'open', 'high', 'low', 'close', or 'volume'
+        start_dt: Timestamp
+           Beginning of the window range.
+        end_dt: Timestamp
+           End of the window range.
+        sids : list of int
+           The asset identifiers in the window.
+
+        Returns
+        -------
+        list of np.ndarray
+            A list with an entry per field of ndarrays with shape
+            (minutes in range, sids) with a dtype of float64, containing the
+            values for the respective field over start and end dt range.
+            Minutes are the trading calendar's, like SqlMinuteReader, NaN
+            (0 volume) where there is no bar.
+        """
+        minutes = self.trading_calendar.minutes_in_range(start_dt, end_dt)
+        keys = minutes.values.astype('datetime64[ns]').view(np.int64)
+
+        results = []
+        for field in fields:
+            out = np.empty((len(keys), len(sids)))
+            out.fill(0 if field == 'volume' else np.nan)
+            results.append(out)
+        if not len(keys):
+            return results
+
+        for i, s in enumerate(sids):
+            columns = self.columns(s)
+            datetimes = columns['datetime']
+            first = np.searchsorted(datetimes, keys[0])
+            datetimes = datetimes[first:np.searchsorted(datetimes, keys[-1], side='right')]
+            if not len(datetimes):
+                continue
+            positions = np.searchsorted(datetimes, keys).clip(0, len(datetimes) - 1)
+            found = datetimes[positions] == keys
+            positions = first + positions[found]
+
+            for field, result in zip(fields, results):
+                scale = VOLUME_MULTIPLIER if field == 'volume' else utils.float_multiplier(s)
+                result[found, i] = columns[field][positions] * scale
+        return results
+
+
+def _open_columns(folder, length):
+    columns = {}
+    for name, dtype in COLUMNS:
+        if length:
+            columns[name] = np.memmap(column_path(folder, name, dtype), dtype=dtype, mode='r', shape=(length,))
+        else:
+            columns[name] = np.empty(0, dtype=dtype)
+    return columns
+
+
+def _files_version(folder):
+    """ The size and modification time of the meta and column files of folder """
+    version = []
+    for filename in [META_FILENAME] + [os.path.basename(column_path(folder, name, dtype)) for name, dtype in COLUMNS]:
+        try:
+            stat = os.stat(os.path.join(folder, filename))
+            version.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+def _read_meta(folder):
+    path = os.path.join(folder, META_FILENAME)
+    if not os.path.exists(path):
+        return {'version': VERSION, 'length': 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_meta(folder, length):
+    path = os.path.join(folder, META_FILENAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': VERSION, 'length': length}, f)
+    os.replace(path + '.tmp', path)
+
+
+def _merge(stored, columns):
+    """ stored and new columns, sorted by datetime, new bars replacing stored ones of the same minute """
+    new = columns['datetime']
+    replaced = new[np.searchsorted(new, stored['datetime']).clip(0, len(new) - 1)] == stored['datetime']
+    merged = dict((name, np.concatenate([stored[name][~replaced], columns[name]])) for name, _ in COLUMNS)
+    order = np.argsort(merged['datetime'], kind='mergesort')
+    return dict((name, values[order]) for name, values in merged.items())
+
+
+def _checked_cast(values, dtype, name):
+    cast = np.asarray(values).astype(dtype)
+    if not np.array_equal(cast, values):
+        raise ValueError('{} values do not fit in {}'.format(name, np.dtype(dtype).name))
+    return cast
@@ -1,22 +1,22 @@
-from ..zipline_extension.assets.asset_writer import AssetDBWriter
+from ..zipline_extension.assets.asset_writer import AssetDBWriter, _dt_to_epoch_s
 from ..zipline_extension.assets import AssetFinder, Equity
 
 import os
+import time
 import numpy as np
 import pandas as pd
 from sqlalchemy import (
     create_engine,
-    Table,
     MetaData,
-    Column,
-    Integer,
-    String,
-    DateTime,
     select,
+    bindparam,
     exc
 )
 from ..broker import Oanda
 from .. import utils
+from .memmap_bars import MemmapMinuteBarWriter
+from .sql_bar_writer import SqlMinuteBarWriter
+from .price_stream import PriceStream
 from zipline.assets.asset_writer import write_version_info
 from zipline.assets.asset_db_schema import version_info, metadata, ASSET_DB_VERSION
 
@@ -34,16 +34,38 @@ class OandaMinutePriceIngest():
 
     Live/backtest algos can access the persisted price history.
 
+    stream writes bars live, from the price stream of many instruments,
+    while run and Backfill write completed candles from the REST API.
+
+    Bars go to minute_bars_<SYMBOL> tables of db_url, or with the 'shared'
+    layout to its minute_bars table keyed by (sid, ts), or, given
+    memmap_root, to a memmap store there (see memmap_bars) read by
+    MemmapMinuteBarReader. Asset info is kept in db_url either way.
+
+    Asset start and end dates follow the bars written, and are saved by
+    flush, which run calls. Callers of write flush when done, or set
+    asset_flush_interval to have them saved every that many seconds.
+
     """
 
     VERSION = 0
 
-    def __init__(self, db_url):
+    def __init__(self, db_url, memmap_root=None, layout='per_symbol', asset_flush_interval=None):
         self.broker = Oanda(os.environ.get("OANADA_ACCOUNT_ID", "test"))
 
         echo = os.environ.get("SQL_ECHO", False) == 'true'
         self.engine = create_engine(db_url,
                                     echo=echo)
+        if memmap_root:
+            self.bar_writer = MemmapMinuteBarWriter(memmap_root)
+        else:
+            self.bar_writer = SqlMinuteBarWriter(self.engine, layout)
+
+        self.asset_flush_interval = asset_flush_interval
+        self._finder = None
+        self._asset_dates = {}
+        self._changed_assets = set()
+        self._assets_flushed_at = time.time()
 
     def run(self, symbol, end=None):
         """
@@ -56,10 +78,32 @@ class OandaMinutePriceIngest():
         1.0000, as integer 10000
 
         """
+        df = self.fetch(symbol, end=end)
+        self.write(symbol, df)
+        self.flush()
+
+    def stream(self, symbols, stop=None, **kwargs):
+        """
+        Writes the live minute bars of symbols, aggregated from the price
+        stream, until stop, a threading.Event, is set. kwargs go to
+        PriceStream.
+        """
+        PriceStream(self, symbols, **kwargs).run(stop)
+
+    def fetch(self, symbol, start=None, end=None):
+        """
+        The complete candles of symbol up to end, or from start to end, as
+        bars of integer prices indexed by minute.
+        """
+        if start:
+            start = start.isoformat()
         if end:
             end = end.isoformat()
 
-        candles = self.broker.get_history(symbol, end=end)
+        candles = self.broker.get_history(symbol, start=start, end=end)
+        if not candles:
+            return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'],
+                                index=pd.DatetimeIndex([]))
         df = pd.DataFrame(candles)
         df = df[df['complete']]
 
@@ -75,7 +119,12 @@ class OandaMinutePriceIngest():
         df = df[['open', 'high', 'low', 'close', 'volume']]
 
         convert_price_to_int(df, utils.multiplier(symbol))
+        return df
 
+    def write(self, symbol, df):
+        """ Writes bars of symbol from fetch, and extends its asset dates to them, see flush """
+        if not len(df):
+            return
         self._write_symbol(symbol, df)
         self._write_asset_info(symbol, df)
 
@@ -83,78 +132,93 @@ class OandaMinutePriceIngest():
         return '%s/%s' % (self.broker.oanda.api_url, 'v1/candles')
 
     def _write_symbol(self, symbol, df):
-        self._ensure_table(symbol)
-        self._delete_duplicate_minutes(symbol, df)
-        df.to_sql(name="minute_bars_{}".format(symbol),
-                  con=self.engine,
-                  index_label="datetime",
-                  dtype={"datetime": String(30)},
-                  if_exists='append')
+        self.bar_writer.write(symbol, df)
 
     def _write_asset_info(self, symbol, df):
         """
-          - Loads existing asset info,
-          - compares and update the date boundaries,
-          - then delete the asset info row, because AssetDBWriter doesn't
-                support replacing.
-          - And finally write the new asset info
+        Extends the dates of the asset of symbol to the bars of df. Dates
+        are kept in memory, and written by flush, when run ends or every
+        asset_flush_interval seconds.
         """
-
-        try:
-            reader = AssetFinder(self.engine)
-        except exc.InvalidRequestError as err:
-            if 'Could not reflect' in str(err):
-                metadata.create_all(self.engine, checkfirst=True)
-                self._ensure_version()
-            reader = AssetFinder(self.engine)
-
         sid = utils.sid(symbol)
-        asset = reader.retrieve_asset(sid, default_none=True) \
-                or Equity(sid, "forex",
-                          symbol=symbol,
-                          asset_name=utils.display_name(sid))
-        self.asset_metadata = build_tzaware_metadata(asset)
+        if sid not in self._asset_dates:
+            asset = self._asset_finder().retrieve_asset(sid, default_none=True)
+            self._asset_dates[sid] = {
+                'symbol': symbol,
+                'start_date': asset.start_date if asset is not None else None,
+                'end_date': asset.end_date if asset is not None else None,
+                'new': asset is None,
+            }
+        dates = self._asset_dates[sid]
 
         # Construct a tz-aware index, for date comparison
         index = df.index.tz_localize('UTC')
 
-        changed = False
-        if self.asset_metadata.ix[sid, 'start_date'] is pd.NaT or self.asset_metadata.start_date.ix[sid] > index[0]:
-            changed = True
-            self.asset_metadata.ix[sid, 'start_date'] = index[0]
-
-        if self.asset_metadata.ix[sid, 'end_date'] is pd.NaT or self.asset_metadata.end_date.ix[sid] < index[-1]:
-            changed = True
-            self.asset_metadata.ix[sid, 'end_date'] = index[-1]
-            self.asset_metadata.ix[sid, 'auto_close_date'] = index[-1] + pd.Timedelta(days=1)
-
-        if changed:
-            writer = AssetDBWriter(self.engine)
-            self._delete_existing_asset_metadata(sid)
-            self.asset_metadata['start_date'] = self.asset_metadata.start_date.dt.date
-            self.asset_metadata['end_date'] = self.asset_metadata.end_date.dt.date
-            self.asset_metadata['auto_close_date'] = self.asset_metadata.auto_close_date.dt.date
-            writer.write(equities=self.asset_metadata.dropna())
-
-    def _ensure_table(self, symbol):
-        table(symbol).create(self.engine, checkfirst=True)
-
-    def _delete_duplicate_minutes(self, symbol, df):
-        c = self.engine.connect()
-        datetime_list = df.index.strftime("%Y-%m-%d %H:%M:%S")
-        t = table(symbol)
-        c.execute(t.delete().where(t.c.datetime.in_(datetime_list)))
-        c.close()
-
-    def _delete_existing_asset_metadata(self, sid):
-        meta = MetaData(self.engine, reflect=True)
-        c = self.engine.connect()
+        if dates['start_date'] is None or dates['start_date'] > index[0]:
+            dates['start_date'] = index[0]
+            self._changed_assets.add(sid)
 
-        for t in ['equity_symbol_mappings', 'asset_router', 'equities']:
-            table = meta.tables[t]
-            c.execute(table.delete().where(table.c.sid == sid))
+        if dates['end_date'] is None or dates['end_date'] < index[-1]:
+            dates['end_date'] = index[-1]
+            self._changed_assets.add(sid)
 
-        c.close()
+        if self.asset_flush_interval is not None and \
+                time.time() - self._assets_flushed_at >= self.asset_flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the asset dates changed since the last flush: new assets
+        through AssetDBWriter, the others by one UPDATE of equities and
+        one of equity_symbol_mappings, for all of them.
+        """
+        self._assets_flushed_at = time.time()
+        if not self._changed_assets:
+            return
+        changed = [(sid, self._asset_dates[sid]) for sid in sorted(self._changed_assets)]
+
+        new = [build_asset_metadata(sid, dates) for sid, dates in changed if dates['new']]
+        if new:
+            AssetDBWriter(self.engine).write(equities=pd.concat(new))
+
+        updates = [{
+            'asset_sid': sid,
+            'asset_start_date': _epoch_date(dates['start_date']),
+            'asset_end_date': _epoch_date(dates['end_date']),
+            'asset_auto_close_date': _epoch_date(dates['end_date'] + pd.Timedelta(days=1)),
+        } for sid, dates in changed if not dates['new']]
+        if updates:
+            finder = self._asset_finder()
+            equities, mappings = finder.equities, finder.equity_symbol_mappings
+            with self.engine.begin() as conn:
+                conn.execute(equities.update()
+                             .where(equities.c.sid == bindparam('asset_sid'))
+                             .values(start_date=bindparam('asset_start_date'),
+                                     end_date=bindparam('asset_end_date'),
+                                     auto_close_date=bindparam('asset_auto_close_date')),
+                             updates)
+                conn.execute(mappings.update()
+                             .where(mappings.c.sid == bindparam('asset_sid'))
+                             .values(start_date=bindparam('asset_start_date'),
+                                     end_date=bindparam('asset_end_date')),
+                             updates)
+
+        for _, dates in changed:
+            dates['new'] = False
+        self._changed_assets.clear()
+
+    def _asset_finder(self):
+        """ The AssetFinder of engine, reused across writes, creating the asset tables if missing """
+        if self._finder is None:
+            try:
+                self._finder = AssetFinder(self.engine)
+            except exc.InvalidRequestError as err:
+                if 'Could not reflect' not in str(err):
+                    raise
+                metadata.create_all(self.engine, checkfirst=True)
+                self._ensure_version()
+                self._finder = AssetFinder(self.engine)
+        return self._finder
 
     def _ensure_version(self):
         meta = MetaData(self.engine, reflect=True)
@@ -178,15 +242,24 @@ def convert_price_to_int(df, ratio):
     df.close = (df.close * ratio).astype(int)
 
 
-def table(symbol):
-    metadata = MetaData()
-    return Table('minute_bars_{}'.format(symbol), metadata,
-                 Column('datetime', DateTime, primary_key=True),
-                 Column('open', Integer, nullable=False),
-                 Column('high', Integer, nullable=False),
-                 Column('low', Integer, nullable=False),
-                 Column('close', Integer, nullable=False),
-                 Column('volume', Integer, nullable=False))
+def build_asset_metadata(sid, dates):
+    """ The AssetDBWriter equities frame of a new asset, with dates as days """
+    asset = Equity(sid, "forex",
+                   symbol=dates['symbol'],
+                   asset_name=utils.display_name(sid))
+    df = build_tzaware_metadata(asset)
+    df.ix[sid, 'start_date'] = dates['start_date']
+    df.ix[sid, 'end_date'] = dates['end_date']
+    df.ix[sid, 'auto_close_date'] = dates['end_date'] + pd.Timedelta(days=1)
+    df['start_date'] = df.start_date.dt.date
+    df['end_date'] = df.end_date.dt.date
+    df['auto_close_date'] = df.auto_close_date.dt.date
+    return df.dropna()
+
+
+def _epoch_date(dt):
+    """ The day of dt as stored in the asset tables by AssetDBWriter """
+    return int(_dt_to_epoch_s(pd.Series([pd.Timestamp(dt.date())]))[0])
 
 
 def build_tzaware_metadata(asset):
@@ -0,0 +1,242 @@
+"""
+Live minute bars from oanda's price stream (see
+http://developer.oanda.com/rest-live/streaming/). One connection streams
+the ticks of many instruments as lines of json:
+
+    {"tick": {"instrument": "EUR_USD", "time": "2016-09-01T00:00:01.123456Z", "bid": 1.11, "ask": 1.1102}}
+    {"heartbeat": {"time": "2016-09-01T00:00:05.000000Z"}}
+
+Ticks are aggregated into minute bars in memory, and bars are written as
+soon as their minute is over. Only complete minutes are written: the bars
+in progress when the stream stops are dropped, their candles being left to
+the REST ingest or backfill.
+"""
+import os
+import json
+import logging
+import threading
+import pandas as pd
+import requests
+
+from .. import utils
+
+STREAM_URLS = {
+    'sandbox': 'http://stream-sandbox.oanda.com/v1/prices',
+    'practice': 'https://stream-fxpractice.oanda.com/v1/prices',
+    'live': 'https://stream-fxtrade.oanda.com/v1/prices',
+}
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+log = logging.getLogger(__name__)
+
+
+class MinuteBarAggregator(object):
+    """
+    Aggregates ticks into minute bars of mid prices, volume being the
+    number of ticks, like oanda's midpoint candles.
+
+    Ticks must come in time order across instruments, as the stream sends
+    them: a tick or heartbeat of a later minute completes the bars of every
+    instrument. Ticks of a minute already completed are dropped.
+
+    Attributes
+    ----------
+    bars : dict of str to list
+        The bar in progress of each instrument, [open, high, low, close,
+        volume]
+    last_bars : dict of str to tuple
+        The last completed bar of each instrument, see advance
+    """
+
+    def __init__(self):
+        self.minute = None
+        self.bars = {}
+        self.last_bars = {}
+
+    def tick(self, instrument, time, bid, ask):
+        """
+        Parameters
+        ----------
+        instrument : str
+        time : str
+            RFC 3339 UTC time, as sent by the stream
+        bid, ask : float
+
+        Returns
+        -------
+        list of tuple
+            The bars completed by the tick, see advance
+        """
+        completed = self.advance(time)
+        if time[:16] < self.minute:
+            log.warning('Dropping late tick of %s at %s', instrument, time)
+            return completed
+
+        mid = (bid + ask) / 2.0
+        bar = self.bars.get(instrument)
+        if bar is None:
+            self.bars[instrument] = [mid, mid, mid, mid, 1]
+        else:
+            if mid > bar[1]:
+                bar[1] = mid
+            elif mid < bar[2]:
+                bar[2] = mid
+            bar[3] = mid
+            bar[4] += 1
+        return completed
+
+    def advance(self, time):
+        """
+        Completes the bars of minutes before that of time.
+
+        Returns
+        -------
+        list of tuple
+            (instrument, minute, open, high, low, close, volume) of each
+            completed bar, minute being a naive UTC pd.Timestamp
+        """
+        # Minutes of RFC 3339 times compare as strings
+        minute = time[:16]
+        if self.minute is not None and minute <= self.minute:
+            return []
+
+        completed = self.flush()
+        self.minute = minute
+        return completed
+
+    def flush(self):
+        """
+        Completes the bars in progress, of the current minute.
+
+        Returns
+        -------
+        list of tuple
+            See advance
+        """
+        completed = []
+        if self.bars:
+            start = pd.Timestamp(self.minute)
+            completed = [(instrument, start) + tuple(bar) for instrument, bar in sorted(self.bars.items())]
+            self.last_bars.update((bar[0], bar) for bar in completed)
+            self.bars = {}
+        return completed
+
+
+class PriceStream(object):
+    """
+    Streams the prices of instruments, and writes their minute bars with
+    ingest as they complete, flushing its asset dates after each minute.
+
+    The stream is reconnected when it closes, fails, or sends nothing,
+    not even a heartbeat, for heartbeat_timeout seconds. Reconnections
+    wait reconnect_wait seconds, doubled up to max_reconnect_wait while
+    they keep failing.
+
+    Parameters
+    ----------
+    ingest : OandaMinutePriceIngest
+        Or any object with write(symbol, bars) and flush()
+    instruments : list of str
+    url : str
+        Defaults to the stream of the OANDA_ENV environment
+    account_id : str
+        Defaults to that of ingest's broker
+    access_token : str
+        Defaults to the OANDA_ACCESS_TOKEN environment variable
+    heartbeat_timeout : float
+    reconnect_wait : float
+    max_reconnect_wait : float
+    """
+
+    def __init__(self, ingest, instruments, url=None, account_id=None, access_token=None,
+                 heartbeat_timeout=10.0, reconnect_wait=1.0, max_reconnect_wait=60.0):
+        self.ingest = ingest
+        self.instruments = list(instruments)
+        self.url = url or STREAM_URLS[os.getenv("OANDA_ENV", "practice")]
+        self.account_id = account_id or ingest.broker.id
+        self.access_token = access_token or os.getenv("OANDA_ACCESS_TOKEN", "xxx")
+        self.heartbeat_timeout = heartbeat_timeout
+        self.reconnect_wait = reconnect_wait
+        self.max_reconnect_wait = max_reconnect_wait
+        self.aggregator = MinuteBarAggregator()
+        self.connections = 0
+        self._session = requests.Session()
+
+    def run(self, stop=None):
+        """
+        Streams until stop, a threading.Event, is set, forever if None.
+        The bars in progress are then dropped, and ingest flushed.
+        """
+        stop = stop or threading.Event()
+        wait = self.reconnect_wait
+        try:
+            while not stop.is_set():
+                try:
+                    for line in self._lines():
+                        wait = self.reconnect_wait
+                        self._handle(line)
+                        if stop.is_set():
+                            break
+                    else:
+                        log.warning('Price stream closed, reconnecting in %ss', wait)
+                except requests.exceptions.RequestException as err:
+                    log.warning('Price stream failed, reconnecting in %ss: %s', wait, err)
+                if stop.wait(wait):
+                    break
+                wait = min(wait * 2, self.max_reconnect_wait)
+        finally:
+            # Ticks of the minute in progress may still come, its bars are
+            # incomplete
+            dropped = self.aggregator.flush()
+            if dropped:
+                log.info('Dropping the bars in progress of %s', ', '.join(bar[0] for bar in dropped))
+            self.ingest.flush()
+
+    def _lines(self):
+        self.connections += 1
+        response = self._session.get(self.url,
+                                     params={'accountId': self.account_id,
+                                             'instruments': ','.join(self.instruments)},
+                                     headers={'Authorization': 'Bearer {}'.format(self.access_token)},
+                                     stream=True,
+                                     timeout=(self.heartbeat_timeout, self.heartbeat_timeout))
+        try:
+            response.raise_for_status()
+            # Lines are short and far between, a larger chunk would hold
+            # them back until it fills
+            for line in response.iter_lines(chunk_size=1):
+                if line:
+                    yield line
+        finally:
+            response.close()
+
+    def _handle(self, line):
+        try:
+            message = json.loads(line.decode('utf-8'))
+        except ValueError:
+            log.warning('Skipping malformed price stream line %r', line)
+            return
+
+        if 'tick' in message:
+            tick = message['tick']
+            completed = self.aggregator.tick(tick['instrument'], tick['time'], tick['bid'], tick['ask'])
+        elif 'heartbeat' in message:
+            completed = self.aggregator.advance(message['heartbeat']['time'])
+        else:
+            log.info('Price stream message %s', message)
+            return
+
+        if completed:
+            self._publish(completed)
+
+    def _publish(self, completed):
+        for instrument in sorted(set(bar[0] for bar in completed)):
+            bars = [bar for bar in completed if bar[0] == instrument]
+            df = pd.DataFrame([bar[2:] for bar in bars], columns=BAR_COLUMNS,
+                              index=pd.DatetimeIndex([bar[1] for bar in bars]))
+            ratio = utils.multiplier(instrument)
+            for column in ['open', 'high', 'low', 'close']:
+                df[column] = (df[column] * ratio).round().astype(int)
+            self.ingest.write(instrument, df)
+        self.ingest.flush()
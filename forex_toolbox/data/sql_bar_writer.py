@@ -0,0 +1,126 @@
+"""
+Bulk writes of minute bars to the sql bar tables, see bar_schema.
+
+Bars are upserted, a new bar replacing a stored one of the same minute,
+one transaction per batch. On PostgreSQL a batch is streamed with COPY
+FROM STDIN into a temporary staging table, then merged by a single
+INSERT ... ON CONFLICT DO UPDATE. On SQLite it is one executemany of
+INSERT OR REPLACE.
+"""
+import io
+import numpy as np
+import pandas as pd
+
+from .. import utils
+from .bar_schema import (
+    bar_table,
+    shared_bar_table,
+    ensure_table,
+    ensure_shared_table,
+    ensure_partitions,
+    LAYOUTS,
+)
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+DEFAULT_BATCH_SIZE = 100000
+
+
+class SqlMinuteBarWriter(object):
+    """
+    Writes minute bars to the minute_bars_<SYMBOL> tables of engine, or to
+    its minute_bars table with the 'shared' layout, creating them if
+    missing. Tables and partitions are only ensured the first time the
+    writer writes to them.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+    layout : str
+        'per_symbol' or 'shared'
+    batch_size : int
+        Bars written per transaction
+    """
+
+    def __init__(self, engine, layout='per_symbol', batch_size=DEFAULT_BATCH_SIZE):
+        if layout not in LAYOUTS:
+            raise ValueError('Unknown bar table layout {}, pick one of {}'.format(layout, ', '.join(LAYOUTS)))
+        self.engine = engine
+        self.layout = layout
+        self.batch_size = batch_size
+        self._tables = set()
+        self._partitions = set()
+
+    def write(self, symbol, df):
+        """
+        Parameters
+        ----------
+        symbol : str
+        df : pd.DataFrame
+            Integer open, high, low, close and volume columns, indexed by
+            minute, naive UTC. Of bars of the same minute, the last is kept.
+        """
+        if not len(df):
+            return
+        df = df[~df.index.duplicated(keep='last')]
+        ts = df.index.values.astype('datetime64[ns]').view(np.int64)
+        if self.layout == 'shared':
+            table = shared_bar_table()
+            if table.name not in self._tables:
+                ensure_shared_table(self.engine)
+                self._tables.add(table.name)
+            self._ensure_partitions(df.index)
+            keys = [np.full(len(df), utils.sid(symbol), dtype=np.int64), ts]
+        else:
+            table = bar_table(symbol)
+            if table.name not in self._tables:
+                ensure_table(self.engine, symbol)
+                self._tables.add(table.name)
+            keys = [ts]
+
+        rows = np.column_stack(keys + [df[name].values.astype(np.int64) for name in BAR_COLUMNS])
+        columns = [column.name for column in table.columns]
+        for start in range(0, len(rows), self.batch_size):
+            self.upsert(table.name, columns, rows[start:start + self.batch_size],
+                        [column.name for column in table.primary_key])
+
+    def _ensure_partitions(self, index):
+        if self.engine.dialect.name != 'postgresql':
+            return
+        months = [month for month in np.unique(index.values.astype('datetime64[M]'))
+                  if month not in self._partitions]
+        if months:
+            ensure_partitions(self.engine, pd.Timestamp(months[0]), pd.Timestamp(months[-1]))
+            self._partitions.update(months)
+
+    def upsert(self, name, columns, rows, keys):
+        """
+        Inserts or replaces rows, an int64 array with one column per name
+        of columns, into table name whose primary key is keys, in one
+        transaction.
+        """
+        dialect = self.engine.dialect.name
+        with self.engine.begin() as conn:
+            if dialect == 'postgresql':
+                _copy_upsert(conn, name, columns, rows, keys)
+            elif dialect == 'sqlite':
+                conn.connection.cursor().executemany(
+                    'INSERT OR REPLACE INTO "{}" ({}) VALUES ({})'.format(
+                        name, ', '.join(columns), ', '.join('?' * len(columns))),
+                    rows.tolist())
+            else:
+                raise ValueError('Bulk bar writes are not supported on {}'.format(dialect))
+
+
+def _copy_upsert(conn, name, columns, rows, keys):
+    staging = '{}_staging'.format(name)
+    data = io.StringIO('\n'.join(','.join(map(str, row)) for row in rows.tolist()))
+
+    cursor = conn.connection.cursor()
+    cursor.execute('CREATE TEMPORARY TABLE "{}" (LIKE "{}") ON COMMIT DROP'.format(staging, name))
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(staging, ', '.join(columns)), data)
+    cursor.execute('INSERT INTO "{table}" ({columns}) SELECT {columns} FROM "{staging}" '
+                   'ON CONFLICT ({keys}) DO UPDATE SET {updates}'.format(
+                       table=name, staging=staging, columns=', '.join(columns), keys=', '.join(keys),
+                       updates=', '.join('{0} = EXCLUDED.{0}'.format(column)
+                                         for column in columns if column not in keys)))
@@ -0,0 +1,134 @@
+import json
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+import pandas as pd
+import pytest
+
+from .backfill import Backfill, Checkpoint, RateLimiter, time_slices
+from .oanda_minute_price_ingest import OandaMinutePriceIngest
+
+
+class CandleServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def candles(instrument, start, end):
+    """ One candle per minute from start to end, both included, as oanda's v1 candles endpoint """
+    minutes = pd.date_range(pd.Timestamp(start).tz_convert(None), pd.Timestamp(end).tz_convert(None), freq='1min')
+    return {'instrument': instrument,
+            'granularity': 'M1',
+            'candles': [{'time': minute.strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+                         'openMid': 1.1, 'highMid': 1.1002, 'lowMid': 1.0999,
+                         'closeMid': 1.1 + minute.minute * 0.00001,
+                         'volume': 10, 'complete': True}
+                        for minute in minutes]}
+
+
+@pytest.fixture
+def server():
+    server = None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = dict(parse_qsl(urlparse(self.path).query))
+            server.requests.append(params)
+            if server.failures.get(params['instrument'], 0) > 0:
+                server.failures[params['instrument']] -= 1
+                self.reply(500, {'code': 500, 'message': 'Try again'})
+            else:
+                self.reply(200, candles(params['instrument'], params['start'], params['end']))
+
+        def reply(self, status, body):
+            body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = CandleServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.failures = {}
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ingest(tmpdir, server):
+    ingest = OandaMinutePriceIngest('sqlite:///{}'.format(tmpdir.join('bars.db')))
+    ingest.broker.oanda.api_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    return ingest
+
+
+def bar_count(ingest, symbol):
+    return ingest.engine.execute('SELECT count(*) FROM "minute_bars_{}"'.format(symbol)).scalar()
+
+
+def test_time_slices():
+    slices = time_slices('2016-09-01', '2016-09-01 20:00', minutes=500)
+    assert [(start.strftime('%H:%M'), end.strftime('%H:%M')) for start, end in slices] == \
+        [('00:00', '08:20'), ('08:20', '16:40'), ('16:40', '20:00')]
+    assert str(slices[0][0].tz) == 'UTC'
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(200)
+    start = pd.Timestamp.now()
+    for _ in range(21):
+        limiter.acquire()
+    assert pd.Timestamp.now() - start >= pd.Timedelta('100ms')
+
+
+def test_backfill(server, ingest):
+    server.failures['USD_JPY'] = 2
+    backfill = Backfill(ingest, ['EUR_USD', 'USD_JPY'], '2016-09-01', '2016-09-03',
+                        workers=4, rate=1000, backoff=0)
+
+    assert backfill.run() == 12
+    assert len(server.requests) == 12 + 2
+    assert bar_count(ingest, 'EUR_USD') == 2 * 24 * 60
+    assert bar_count(ingest, 'USD_JPY') == 2 * 24 * 60
+
+
+def test_backfill_fails_fast(server, ingest):
+    server.failures['EUR_USD'] = 1
+    backfill = Backfill(ingest, ['EUR_USD'], '2016-09-01', '2016-09-08',
+                        workers=1, rate=1000, retries=0)
+
+    with pytest.raises(Exception):
+        backfill.run()
+    # The slices after the failed one are cancelled, not fetched
+    assert len(server.requests) == 1
+    assert len(backfill.slices()) == len(time_slices('2016-09-01', '2016-09-08'))
+
+
+def test_backfill_resumes_from_checkpoint(tmpdir, server, ingest):
+    checkpoint = str(tmpdir.join('backfill.json'))
+    server.failures['USD_JPY'] = 1000
+    backfill = Backfill(ingest, ['EUR_USD', 'USD_JPY'], '2016-09-01', '2016-09-03',
+                        workers=2, rate=1000, checkpoint=checkpoint, retries=1, backoff=0)
+    with pytest.raises(Exception):
+        backfill.run()
+    left = len(backfill.slices())
+    assert left == len(Backfill(ingest, ['EUR_USD', 'USD_JPY'], '2016-09-01', '2016-09-03',
+                                checkpoint=Checkpoint(checkpoint)).slices())
+    assert left >= 6
+
+    server.failures.clear()
+    server.requests[:] = []
+    resumed = Backfill(ingest, ['EUR_USD', 'USD_JPY'], '2016-09-01', '2016-09-03',
+                       workers=2, rate=1000, checkpoint=checkpoint)
+    assert resumed.run() == left
+    assert len(server.requests) == left
+    assert resumed.slices() == []
+    assert bar_count(ingest, 'EUR_USD') == 2 * 24 * 60
+    assert bar_count(ingest, 'USD_JPY') == 2 * 24 * 60
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, Table, MetaData, Column, Integer, String, DateTime
+
+from . import bar_schema
+
+
+@pytest.fixture
+def engine(tmpdir):
+    return create_engine('sqlite:///{}'.format(tmpdir.join('bars.db')))
+
+
+def legacy_table(engine, symbol, datetime_type):
+    columns = ['open', 'high', 'low', 'close', 'volume']
+    bars = pd.DataFrame({'open': [1, 2], 'high': [3, 4], 'low': [0, 1], 'close': [2, 3], 'volume': [5, 6]},
+                        index=pd.DatetimeIndex(['2016-09-01 00:00', '2016-09-01 00:01'], name='datetime'),
+                        columns=columns)
+    Table('minute_bars_{}'.format(symbol), MetaData(),
+          Column('datetime', datetime_type, primary_key=True),
+          *[Column(name, Integer, nullable=False) for name in columns]
+          ).create(engine)
+    bars.to_sql('minute_bars_{}'.format(symbol), engine, if_exists='append')
+    return bars
+
+
+@pytest.mark.parametrize("datetime_type", [String(30), DateTime])
+def test_migrate(engine, datetime_type):
+    bars = legacy_table(engine, 'EUR_USD', datetime_type)
+    assert bar_schema.table_version(engine, 'EUR_USD') == 0
+    with pytest.raises(ValueError):
+        bar_schema.ensure_table(engine, 'EUR_USD')
+
+    assert bar_schema.migrate(engine, 'EUR_USD') == 0
+    assert bar_schema.table_version(engine, 'EUR_USD') == bar_schema.SCHEMA_VERSION
+    assert bar_schema.migrate(engine, 'EUR_USD') == bar_schema.SCHEMA_VERSION
+
+    migrated = pd.read_sql_table('minute_bars_EUR_USD', engine, index_col='ts')
+    assert list(migrated.index) == [ts.value for ts in bars.index]
+    assert (migrated[bars.columns].values == bars.values).all()
+
+
+def test_range_queries_use_the_primary_key(engine):
+    bar_schema.ensure_table(engine, 'EUR_USD')
+    plan = engine.execute('EXPLAIN QUERY PLAN SELECT * FROM "minute_bars_EUR_USD" '
+                          'WHERE ts >= 1472688000000000000 AND ts < 1475280000000000000').fetchall()
+    assert 'USING INDEX' in ' '.join(str(row) for row in plan)
+
+
+def test_shared_table_range_queries_use_the_primary_key(engine):
+    bar_schema.ensure_shared_table(engine)
+    bar_schema.ensure_shared_table(engine)
+    plan = engine.execute('EXPLAIN QUERY PLAN SELECT * FROM minute_bars '
+                          'WHERE sid IN (37, 38) AND ts >= 1472688000000000000 AND ts < 1475280000000000000 '
+                          'ORDER BY sid, ts').fetchall()
+    plan = ' '.join(str(row) for row in plan)
+    assert 'USING INDEX' in plan
+    assert 'TEMP B-TREE' not in plan
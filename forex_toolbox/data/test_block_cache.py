@@ -0,0 +1,57 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from .block_cache import BlockCache
+
+
+class Loader(object):
+    """ Bars of every minute, close being the minutes since the epoch """
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, sid, start, end):
+        with self.lock:
+            self.calls.append((sid, start))
+        index = pd.date_range(start, end, freq='1Min', closed='left', name='datetime')
+        return pd.DataFrame({'close': index.values.astype(np.int64) // 60000000000}, index=index)
+
+
+def test_blocks_are_loaded_once_and_next_prefetched():
+    loader = Loader()
+    cache = BlockCache(loader, block_size='1D')
+    dt = pd.Timestamp('2016-09-01 10:30')
+
+    assert cache.get(37, dt).close.ix[dt] == dt.value // 60000000000
+    cache.get(37, dt + pd.Timedelta(minutes=1))
+    cache.close()
+
+    assert loader.calls == [(37, pd.Timestamp('2016-09-01')), (37, pd.Timestamp('2016-09-02'))]
+    cache.get(37, pd.Timestamp('2016-09-02 23:59'))
+    assert len(loader.calls) == 2
+
+
+def test_memory_budget_evicts_least_recently_used():
+    loader = Loader()
+    cache = BlockCache(loader, block_size='1D', prefetch=False)
+    block_bytes = cache.get(37, pd.Timestamp('2016-09-01')).memory_usage(index=True).sum()
+    cache.memory_budget = 2 * block_bytes
+
+    cache.get(38, pd.Timestamp('2016-09-01'))
+    cache.get(37, pd.Timestamp('2016-09-01'))
+    cache.get(37, pd.Timestamp('2016-09-02'))
+    assert cache.nbytes == 2 * block_bytes
+    assert len(loader.calls) == 3
+
+    cache.get(37, pd.Timestamp('2016-09-01'))
+    assert len(loader.calls) == 3
+    cache.get(38, pd.Timestamp('2016-09-01'))
+    assert len(loader.calls) == 4
+
+
+def test_blocks_span_range():
+    cache = BlockCache(Loader(), block_size='60Min', prefetch=False)
+    blocks = cache.blocks(37, pd.Timestamp('2016-09-01 10:30'), pd.Timestamp('2016-09-01 13:10'))
+    assert [block.index[0] for block in blocks] == list(pd.date_range('2016-09-01 10:00', periods=4, freq='60Min'))
@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import pytest
+import pandas as pd
+
+from .. import utils
+from .memmap_bars import MemmapMinuteBarWriter, MemmapMinuteBarReader
+from .oanda_minute_price_ingest import convert_price_to_int
+from ..zipline_extension import ForexCalendar
+
+
+@pytest.fixture
+def trading_calendar():
+    return ForexCalendar(pd.Timestamp('2016-08-01', tz='utc'))
+
+
+@pytest.fixture
+def bars():
+    df = pd.read_csv("fixtures/m1.csv",
+                     header=None,
+                     names=['symbol', 'date', 'time', 'open', 'high', 'low', 'close', 'volume'],
+                     dtype={'date': str, 'time': str},
+                     nrows=1000)
+    df.index = pd.to_datetime(df.date + df.time, format='%Y%m%d%H%M%S')
+    df = df[['open', 'high', 'low', 'close', 'volume']]
+    convert_price_to_int(df, utils.multiplier('EUR_USD'))
+    return df
+
+
+def test_append_and_read(tmpdir, bars):
+    writer = MemmapMinuteBarWriter(str(tmpdir))
+    writer.write('EUR_USD', bars[:600])
+    writer.write('EUR_USD', bars[600:])
+
+    reader = MemmapMinuteBarReader(str(tmpdir), trading_calendar=object())
+    sid = utils.sid('EUR_USD')
+    reader.load_data_cache([sid])
+    assert (reader.days_of_data == bars.index).all()
+    assert list(reader.columns(sid)['close']) == list(bars.close)
+
+    dt = bars.index[700].tz_localize('UTC')
+    assert reader.get_value(sid, dt, 'price') == bars.close.iloc[700] * utils.float_multiplier(sid)
+    assert reader.get_value(sid, dt, 'volume') == bars.volume.iloc[700] * 1000000000
+    assert np.isnan(reader.get_value(sid, pd.Timestamp('2015-01-01', tz='UTC'), 'close'))
+    assert reader.get_value(sid, pd.Timestamp('2015-01-01', tz='UTC'), 'volume') == 0
+
+
+def test_overlapping_write_replaces_minutes(tmpdir, bars):
+    writer = MemmapMinuteBarWriter(str(tmpdir))
+    writer.write('EUR_USD', bars[:600])
+    changed = bars[500:700].copy()
+    changed['close'] += 1
+    writer.write('EUR_USD', changed)
+
+    reader = MemmapMinuteBarReader(str(tmpdir), trading_calendar=object())
+    close = reader.columns(utils.sid('EUR_USD'))['close']
+    assert len(close) == 700
+    assert list(close[:500]) == list(bars.close[:500])
+    assert list(close[500:]) == list(changed.close)
+
+
+def test_overlapping_tail_is_rewritten_in_place(tmpdir, bars):
+    writer = MemmapMinuteBarWriter(str(tmpdir))
+    writer.write('EUR_USD', bars[:600])
+    reader = MemmapMinuteBarReader(str(tmpdir), trading_calendar=object())
+    sid = utils.sid('EUR_USD')
+    assert len(reader.columns(sid)['close']) == 600
+    close_path = str(tmpdir.join('EUR_USD', 'close.i4'))
+    inode = os.stat(close_path).st_ino
+
+    # Like a poll of the latest candles: the last stored minutes, and new ones
+    changed = bars[590:700].drop(bars.index[595]).copy()
+    changed['close'] += 1
+    writer.write('EUR_USD', changed)
+
+    assert os.stat(close_path).st_ino == inode
+    # The reader maps the files again as they changed
+    close = reader.columns(sid)['close']
+    assert len(close) == 700
+    assert list(close[:590]) == list(bars.close[:590])
+    assert close[595] == bars.close.iloc[595]
+    assert list(close[596:]) == list(changed.close[5:])
+
+    # Bars within the stored range keep the stored bars after them
+    writer.write('EUR_USD', bars[100:110])
+    assert list(reader.columns(sid)['close'][100:]) == list(bars.close[100:110]) + list(close[110:])
+
+
+def test_load_raw_arrays(tmpdir, bars, trading_calendar):
+    writer = MemmapMinuteBarWriter(str(tmpdir))
+    writer.write('EUR_USD', bars.drop(bars.index[150]))
+    writer.write('USD_JPY', bars[::2])
+    eurusd, usdjpy = utils.sid('EUR_USD'), utils.sid('USD_JPY')
+
+    reader = MemmapMinuteBarReader(str(tmpdir), trading_calendar=trading_calendar)
+    start, end = bars.index[100].tz_localize('UTC'), bars.index[199].tz_localize('UTC')
+    close, volume = reader.load_raw_arrays(['close', 'volume'], start, end, [eurusd, usdjpy])
+
+    # One row per calendar minute, even those the first sid has no bar for
+    assert close.shape == volume.shape == (len(trading_calendar.minutes_in_range(start, end)), 2) == (100, 2)
+    expected = bars.close[100:200] * utils.float_multiplier(eurusd)
+    expected.iloc[50] = np.nan
+    np.testing.assert_allclose(close[:, 0], expected)
+    assert volume[50, 0] == 0
+    np.testing.assert_allclose(close[::2, 1], bars.close[100:200:2] * utils.float_multiplier(usdjpy))
+    assert np.isnan(close[1::2, 1]).all()
+    assert (volume[1::2, 1] == 0).all()
+    np.testing.assert_array_equal(np.delete(volume[:, 0], 50), bars.volume[100:200].drop(bars.index[150]) * 1000000000)
@@ -58,3 +58,44 @@ def test_oanda_prices_ingest(candles,
         reader = AssetFinder(eng)
         eurusd = reader.retrieve_asset(37)
         assert eurusd.symbol == "EUR_USD"
+
+
+def test_oanda_prices_ingest_shared_layout(candles, db_url):
+    ingest = OandaMinutePriceIngest(db_url, layout='shared')
+
+    with requests_mock.mock() as m:
+        m.get(ingest.url(), json=candles)
+
+        ingest.run("EUR_USD")
+        ingest.run("EUR_USD")
+
+        eng = create_engine(db_url)
+        c = eng.connect()
+        res = c.execute('SELECT count(*) from minute_bars WHERE sid = 37')
+        assert res.fetchone()[0] == 30965
+        c.close()
+
+
+def test_asset_dates_are_flushed_in_batches(candles, tmpdir):
+    db_url = 'sqlite:///{}'.format(tmpdir.join('bars.db'))
+    ingest = OandaMinutePriceIngest(db_url)
+
+    with requests_mock.mock() as m:
+        m.get(ingest.url(), json=candles)
+        bars = ingest.fetch("EUR_USD")
+
+    ingest.write("EUR_USD", bars[:1000])
+    ingest.write("EUR_USD", bars[1000:2000])
+    assert AssetFinder(create_engine(db_url)).retrieve_asset(37, default_none=True) is None
+
+    ingest.flush()
+    eurusd = AssetFinder(create_engine(db_url)).retrieve_asset(37)
+    assert eurusd.start_date == bars.index[0].tz_localize('UTC').normalize()
+    assert eurusd.end_date == bars.index[1999].tz_localize('UTC').normalize()
+
+    ingest.write("EUR_USD", bars[2000:])
+    ingest.flush()
+    eurusd = AssetFinder(create_engine(db_url)).retrieve_asset(37)
+    assert eurusd.start_date == bars.index[0].tz_localize('UTC').normalize()
+    assert eurusd.end_date == bars.index[-1].tz_localize('UTC').normalize()
+    assert eurusd.auto_close_date == eurusd.end_date + pd.Timedelta(days=1)
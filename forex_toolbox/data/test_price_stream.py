@@ -0,0 +1,161 @@
+import json
+import time
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pandas as pd
+import pytest
+
+from .price_stream import MinuteBarAggregator, PriceStream
+
+
+class StreamServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def tick(instrument, time, bid, ask):
+    return {'tick': {'instrument': instrument, 'time': time, 'bid': bid, 'ask': ask}}
+
+
+def heartbeat(time):
+    return {'heartbeat': {'time': time}}
+
+
+class RecordingIngest(object):
+    """ Stands in for OandaMinutePriceIngest """
+
+    def __init__(self):
+        self.bars = []
+        self.flushes = 0
+
+    def write(self, symbol, df):
+        self.bars.extend((symbol,) + tuple(row) for row in df.itertuples())
+
+    def flush(self):
+        self.flushes += 1
+
+
+@pytest.fixture
+def server():
+    """ Serves server.connections[i], lists of messages, to the i-th connection, then hangs """
+    server = None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            connection = len(server.requests)
+            server.requests.append(self.path)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            messages = server.connections[connection] if connection < len(server.connections) else []
+            for message in messages:
+                if message == 'hang':
+                    time.sleep(1)
+                    continue
+                self.wfile.write(json.dumps(message).encode('utf-8') + b'\r\n')
+                self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    server = StreamServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.connections = []
+    server.url = 'http://127.0.0.1:{}/v1/prices'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_aggregator():
+    aggregator = MinuteBarAggregator()
+    assert aggregator.tick('EUR_USD', '2016-09-01T00:00:01.000000Z', 1.1, 1.1002) == []
+    aggregator.tick('USD_JPY', '2016-09-01T00:00:02.000000Z', 103.1, 103.12)
+    aggregator.tick('EUR_USD', '2016-09-01T00:00:30.000000Z', 1.1004, 1.1006)
+    aggregator.tick('EUR_USD', '2016-09-01T00:00:59.999999Z', 1.0998, 1.1)
+    assert aggregator.bars['EUR_USD'] == [1.1001, 1.1005, 1.0999, 1.0999, 3]
+
+    completed = aggregator.tick('EUR_USD', '2016-09-01T00:01:00.000000Z', 1.1, 1.1002)
+    minute = pd.Timestamp('2016-09-01 00:00')
+    assert completed == [('EUR_USD', minute, 1.1001, 1.1005, 1.0999, 1.0999, 3),
+                         ('USD_JPY', minute, 103.11, 103.11, 103.11, 103.11, 1)]
+    assert aggregator.last_bars['USD_JPY'] == completed[1]
+    assert list(aggregator.bars) == ['EUR_USD']
+
+    # late ticks are dropped, heartbeats complete bars
+    assert aggregator.tick('USD_JPY', '2016-09-01T00:00:59.000000Z', 103.1, 103.12) == []
+    assert aggregator.advance('2016-09-01T00:01:30.000000Z') == []
+    completed = aggregator.advance('2016-09-01T00:03:00.000000Z')
+    assert completed == [('EUR_USD', pd.Timestamp('2016-09-01 00:01'), 1.1001, 1.1001, 1.1001, 1.1001, 1)]
+    assert aggregator.bars == {}
+
+    aggregator.tick('USD_JPY', '2016-09-01T00:03:10.000000Z', 103.1, 103.12)
+    assert aggregator.flush() == [('USD_JPY', pd.Timestamp('2016-09-01 00:03'), 103.11, 103.11, 103.11, 103.11, 1)]
+    assert aggregator.bars == {}
+
+
+def test_stream_reconnects(server):
+    server.connections = [
+        [tick('EUR_USD', '2016-09-01T00:00:01.000000Z', 1.1, 1.1002),
+         tick('USD_JPY', '2016-09-01T00:00:02.000000Z', 103.1, 103.12),
+         tick('EUR_USD', '2016-09-01T00:01:01.000000Z', 1.1004, 1.1006)],
+        # silent, the stream must time out and reconnect
+        [heartbeat('2016-09-01T00:01:05.000000Z'), 'hang', 'hang'],
+        [tick('EUR_USD', '2016-09-01T00:01:30.000000Z', 1.1008, 1.101),
+         'not json',
+         heartbeat('2016-09-01T00:02:00.000000Z')],
+    ]
+    ingest = RecordingIngest()
+    stream = PriceStream(ingest, ['EUR_USD', 'USD_JPY'], url=server.url, account_id='1234',
+                         heartbeat_timeout=0.3, reconnect_wait=0.01)
+    stop = threading.Event()
+    thread = threading.Thread(target=stream.run, args=(stop,))
+    thread.start()
+
+    deadline = time.time() + 10
+    while len(ingest.bars) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join()
+
+    minute = pd.Timestamp('2016-09-01 00:00')
+    assert ingest.bars == [('EUR_USD', minute, 1100100, 1100100, 1100100, 1100100, 1),
+                           ('USD_JPY', minute, 1031100, 1031100, 1031100, 1031100, 1),
+                           ('EUR_USD', minute + pd.Timedelta(minutes=1), 1100500, 1100900, 1100500, 1100900, 2)]
+    assert ingest.flushes >= 2
+    assert len(server.requests) >= 3
+    assert 'instruments=EUR_USD%2CUSD_JPY' in server.requests[0]
+    assert 'accountId=1234' in server.requests[0]
+
+
+def test_stopped_stream_drops_the_minute_in_progress(server):
+    server.connections = [[tick('EUR_USD', '2016-09-01T00:00:01.000000Z', 1.0991, 1.0992), 'hang', 'hang']]
+    ingest = RecordingIngest()
+    stream = PriceStream(ingest, ['EUR_USD'], url=server.url, account_id='1234',
+                         heartbeat_timeout=0.3, reconnect_wait=0.01)
+    stop = threading.Event()
+    thread = threading.Thread(target=stream.run, args=(stop,))
+    thread.start()
+
+    deadline = time.time() + 10
+    while not stream.aggregator.bars and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join()
+
+    assert ingest.bars == []
+    assert stream.aggregator.bars == {}
+    assert ingest.flushes == 1
+
+
+def test_streamed_prices_are_rounded():
+    ingest = RecordingIngest()
+    stream = PriceStream(ingest, ['EUR_USD'], url='http://127.0.0.1:1', account_id='1234')
+    # The mid, 1.09915, scales to 1099149.99..., truncated it would be a unit off
+    stream._publish([('EUR_USD', pd.Timestamp('2016-09-01 00:00'), 1.09915, 1.09915, 1.09915, 1.09915, 1)])
+
+    price = 1099150
+    assert ingest.bars == [('EUR_USD', pd.Timestamp('2016-09-01 00:00'), price, price, price, price, 1)]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from .sql_bar_writer import SqlMinuteBarWriter
+
+
+@pytest.fixture
+def engine(tmpdir):
+    return create_engine('sqlite:///{}'.format(tmpdir.join('bars.db')))
+
+
+def bars(start, periods, price):
+    index = pd.date_range(start, periods=periods, freq='1min')
+    prices = np.arange(price, price + periods)
+    return pd.DataFrame({'open': prices, 'high': prices + 2, 'low': prices - 1, 'close': prices + 1,
+                         'volume': np.arange(periods)}, index=index)
+
+
+@pytest.mark.parametrize("layout,query", [
+    ('per_symbol', 'SELECT * FROM "minute_bars_EUR_USD" ORDER BY ts'),
+    ('shared', 'SELECT * FROM minute_bars WHERE sid = 37 ORDER BY ts'),
+])
+def test_write_upserts(engine, layout, query):
+    writer = SqlMinuteBarWriter(engine, layout, batch_size=7)
+    writer.write('EUR_USD', bars('2016-09-01', 20, 111000))
+    writer.write('EUR_USD', bars('2016-09-01 00:15', 10, 112000))
+    writer.write('USD_JPY', bars('2016-09-01', 5, 10000))
+
+    stored = pd.read_sql(query, engine, index_col='ts')
+    expected = pd.concat([bars('2016-09-01', 15, 111000), bars('2016-09-01 00:15', 10, 112000)])
+    assert list(stored.index) == [ts.value for ts in expected.index]
+    for name in ['open', 'high', 'low', 'close', 'volume']:
+        assert list(stored[name]) == list(expected[name])
+
+
+@pytest.mark.parametrize("layout", ['per_symbol', 'shared'])
+def test_tables_are_ensured_once(engine, layout, monkeypatch):
+    from . import sql_bar_writer
+    ensured = []
+    for name in ['ensure_table', 'ensure_shared_table']:
+        ensure = getattr(sql_bar_writer, name)
+        monkeypatch.setattr(sql_bar_writer, name,
+                            lambda *args, ensure=ensure: ensured.append(args[1:]) or ensure(*args))
+
+    writer = SqlMinuteBarWriter(engine, layout)
+    for minute in range(3):
+        writer.write('EUR_USD', bars(pd.Timestamp('2016-09-01') + pd.Timedelta(minutes=minute), 1, 111000))
+    writer.write('USD_JPY', bars('2016-09-01', 1, 10000))
+    assert ensured == ([('EUR_USD',), ('USD_JPY',)] if layout == 'per_symbol' else [()])
+
+
+def test_write_keeps_the_last_bar_of_a_minute(engine):
+    df = pd.concat([bars('2016-09-01', 2, 111000), bars('2016-09-01 00:01', 1, 113000)])
+    SqlMinuteBarWriter(engine).write('EUR_USD', df)
+    stored = pd.read_sql('SELECT * FROM "minute_bars_EUR_USD" ORDER BY ts', engine)
+    assert list(stored.open) == [111000, 113000]
+
+
+def test_unknown_layout(engine):
+    with pytest.raises(ValueError):
+        SqlMinuteBarWriter(engine, 'columnar')
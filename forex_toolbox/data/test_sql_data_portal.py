@@ -6,7 +6,9 @@ import requests_mock
 from datetime import datetime
 from sqlalchemy import create_engine
 
-from .sql_data_portal import SqlMinuteReader, SqlDataPortal
+from .. import utils
+from .sql_bar_writer import SqlMinuteBarWriter
+from .sql_data_portal import SqlMinuteReader, SqlDataPortal, DenseMinuteBars, NANOS_PER_MINUTE, VOLUME_MULTIPLIER
 from ..zipline_extension import override_nyse
 from ..zipline_extension.assets import AssetFinder
 from ..zipline_extension.finance.trading import BernoullioTradingEnvironment
@@ -110,3 +112,140 @@ def test_sql_data_portal(db_url, asset_finder, candles):
                             ))
     reader = SqlMinuteReader(db_url)
     algo.run(portal(reader, asset_finder))
+
+
+def write_bars(db_url, candles, layout='per_symbol'):
+    """ Writes the candles as EUR_USD bars, and every third as USD_JPY's """
+    bars = pd.DataFrame(candles['candles'])
+    bars.index = pd.to_datetime(bars.time.str[:19])
+    bars = bars.rename(columns={'openMid': 'open', 'highMid': 'high', 'lowMid': 'low', 'closeMid': 'close'})
+    bars = (bars[['open', 'high', 'low', 'close']] * 100000).round().astype(int).join(bars.volume)
+    writer = SqlMinuteBarWriter(create_engine(db_url), layout)
+    writer.write('EUR_USD', bars)
+    writer.write('USD_JPY', bars[::3])
+    return bars
+
+
+def test_lazy_reader_matches_eager(tmpdir, candles):
+    db_url = 'sqlite:///{}'.format(tmpdir.join('bars.db'))
+    bars = write_bars(db_url, candles)
+    sids = [utils.sid('EUR_USD'), utils.sid('USD_JPY')]
+
+    calendar = get_calendar('NYSE')
+    eager = SqlMinuteReader(db_url, trading_calendar=calendar)
+    eager.load_data_cache(sids, start=bars.index[0], end=bars.index[-1])
+    lazy = SqlMinuteReader(db_url, trading_calendar=calendar, lazy=True, block_size='1D', memory_budget=1)
+    lazy.load_data_cache(sids)
+
+    assert (lazy.days_of_data == eager.days_of_data).all()
+    assert lazy.bounds == eager.bounds == (bars.index[0], bars.index[-1])
+    assert lazy.first_trading_day == bars.index[0]
+    for dt in [bars.index[0], bars.index[5000], bars.index[-1], pd.Timestamp('2016-09-04 12:00')]:
+        for field in ['close', 'volume']:
+            assert lazy.get_value(37, dt, field) == eager.get_value(37, dt, field) or \
+                np.isnan(eager.get_value(37, dt, field))
+    for reader in [eager, lazy]:
+        # Not a loaded sid, or not a whole minute
+        for sid, dt in [(utils.sid('EUR_JPY'), bars.index[5000]), (37, bars.index[5000] + pd.Timedelta('30s'))]:
+            assert np.isnan(reader.get_value(sid, dt, 'close'))
+            assert reader.get_value(sid, dt, 'volume') == 0
+        # Not a bar field
+        assert np.isnan(reader.get_value(37, bars.index[5000], 'vwap'))
+
+    start, end = bars.index[1000].tz_localize('UTC'), bars.index[9000].tz_localize('UTC')
+    minutes = calendar.minutes_in_range(start, end).tz_convert(None)
+    close, volume = eager.load_raw_arrays(['close', 'volume'], start, end, sids)
+    assert close.shape == (len(minutes), 2)
+    for i, s in enumerate(sids):
+        expected = bars[bars.index.isin(eager.read_bars(s, bars.index[0], bars.index[-1]).index)].reindex(minutes)
+        np.testing.assert_array_equal(close[:, i], expected.close * utils.float_multiplier(s))
+        np.testing.assert_array_equal(volume[:, i], expected.volume.fillna(0) * VOLUME_MULTIPLIER)
+
+    for l, e in zip(lazy.load_raw_arrays(['open', 'close'], start, end, sids),
+                    eager.load_raw_arrays(['open', 'close'], start, end, sids)):
+        np.testing.assert_array_equal(l, e)
+    lazy.close()
+
+
+def test_shared_layout_matches_per_symbol(tmpdir, candles):
+    db_url = 'sqlite:///{}'.format(tmpdir.join('bars.db'))
+    bars = write_bars(db_url, candles, 'per_symbol')
+    write_bars(db_url, candles, 'shared')
+    sids = [utils.sid('USD_JPY'), utils.sid('EUR_USD')]
+
+    calendar = get_calendar('NYSE')
+    per_symbol = SqlMinuteReader(db_url, trading_calendar=calendar)
+    per_symbol.load_data_cache(sids, start=bars.index[0], end=bars.index[-1])
+    shared = SqlMinuteReader(db_url, trading_calendar=calendar, layout='shared')
+    shared.load_data_cache(sids, start=bars.index[0], end=bars.index[-1])
+    for s in sids:
+        pd.testing.assert_frame_equal(shared.read_bars(s, bars.index[0], bars.index[-1]),
+                                      per_symbol.read_bars(s, bars.index[0], bars.index[-1]))
+
+    start, end = bars.index[1000].tz_localize('UTC'), bars.index[9000].tz_localize('UTC')
+    for s, p in zip(shared.load_raw_arrays(['close', 'volume'], start, end, sids),
+                    per_symbol.load_raw_arrays(['close', 'volume'], start, end, sids)):
+        np.testing.assert_array_equal(s, p)
+
+    lazy = SqlMinuteReader(db_url, trading_calendar=calendar, lazy=True, block_size='1D', layout='shared')
+    lazy.load_data_cache(sids)
+    assert (lazy.days_of_data == per_symbol.days_of_data).all()
+    assert lazy.bounds == per_symbol.bounds
+    assert lazy.get_value(37, bars.index[5000], 'close') == per_symbol.get_value(37, bars.index[5000], 'close')
+    lazy.close()
+
+    with pytest.raises(ValueError):
+        SqlMinuteReader(db_url, layout='columnar')
+
+
+def test_deferred_sids_load_on_first_read(tmpdir, candles):
+    db_url = 'sqlite:///{}'.format(tmpdir.join('bars.db'))
+    bars = write_bars(db_url, candles)
+    eur_usd, usd_jpy, eur_jpy = utils.sid('EUR_USD'), utils.sid('USD_JPY'), utils.sid('EUR_JPY')
+
+    calendar = get_calendar('NYSE')
+    eager = SqlMinuteReader(db_url, trading_calendar=calendar)
+    eager.load_data_cache([eur_usd, usd_jpy], start=bars.index[0], end=bars.index[-1])
+    deferred = SqlMinuteReader(db_url, trading_calendar=calendar)
+    deferred.load_data_cache([eur_usd, usd_jpy, eur_jpy], start=bars.index[0], end=bars.index[-1], deferred=True)
+
+    # EUR_JPY has no bar table
+    assert deferred._sids == [eur_usd, usd_jpy]
+    assert deferred._dense == {}
+    assert deferred.bounds == eager.bounds == (bars.index[0], bars.index[-1])
+    assert deferred.get_value(usd_jpy, bars.index[3000], 'close') == eager.get_value(usd_jpy, bars.index[3000], 'close')
+    assert list(deferred._dense) == [usd_jpy]
+    assert np.isnan(deferred.get_value(eur_jpy, bars.index[3000], 'close'))
+    assert (deferred.days_of_data == eager.days_of_data).all()
+
+
+def test_in_memory_lazy_reader_does_not_prefetch():
+    reader = SqlMinuteReader('sqlite://', lazy=True)
+    assert reader._blocks._executor is None
+    reader.close()
+
+
+def test_dense_minute_bars():
+    index = pd.DatetimeIndex(['2016-09-02 20:58', '2016-09-02 20:59', '2016-09-05 00:01'])
+    df = pd.DataFrame({'open': [111550, 111560, 111570], 'high': [111560, 111570, 111580],
+                       'low': [111540, 111550, 111560], 'close': [111555, 111565, 111575],
+                       'volume': [4, 5, 6]}, index=index)
+    bars = DenseMinuteBars(df, 37)
+
+    assert bars.length == 51 * 60 + 3 + 1
+    assert bars.first_row == index[0].value // NANOS_PER_MINUTE
+    assert bars.fields['close'][1] == 111565 * utils.float_multiplier(37)
+    assert bars.fields['volume'][-1] == 6 * VOLUME_MULTIPLIER
+    assert np.isnan(bars.fields['price'][2])
+    assert bars.fields['volume'][2] == 0
+    assert (bars.minutes() == index).all()
+    assert bars.bounds() == (index[0].value, index[-1].value)
+
+    view = bars.view('close', bars.first_row + 1, 2)
+    assert view.shape == (2, 1)
+    assert not view.flags.writeable
+    assert bars.view('close', bars.first_row - 1, 2) is None
+
+    out = np.zeros(3)
+    bars.fill(out, 'volume', np.array([bars.first_row - 1, bars.first_row, bars.first_row + bars.length - 1]))
+    assert list(out) == [0, 4 * VOLUME_MULTIPLIER, 6 * VOLUME_MULTIPLIER]
@@ -2,21 +2,25 @@
 Implements Ichimoku Kinyo Hyo indicator
 """
 import pytest
+import collections
+import numpy as np
 import pandas as pd
+from .rolling import RollingMinMax, rolling_min_max
 
 
-def lines_data(price, turn=9, base=26, lag_span=52, displacement=26):
+def lines_data(price, turn=9, base=26, lag_span=52, displacement=26, backend=None):
+    """
+    backend picks the rolling min/max implementation, see
+    rolling.rolling_min_max. They all give the same lines.
+    """
     data = pd.DataFrame({'price': price}, index=price.index)
-    base_roll = price.rolling(base)
-    data['base'] = (base_roll.min() + base_roll.max()) / 2.0
-
-    turn_roll = price.rolling(turn)
-    data['turn'] = (turn_roll.min() + turn_roll.max()) / 2.0
+    data['base'] = _mid(price.values, base, backend)
+    data['turn'] = _mid(price.values, turn, backend)
 
     data['lag'] = data.price.shift(-displacement)
     data['cloud1'] = ((data.base + data.turn)/2).shift(displacement)
-    cloud2_roll = price.rolling(lag_span)
-    data['cloud2'] = ((cloud2_roll.min() + cloud2_roll.max())/2).shift(displacement)
+    cloud2 = pd.Series(_mid(price.values, lag_span, backend), index=price.index)
+    data['cloud2'] = cloud2.shift(displacement)
     return data
 
 def mark_signal(data, max_cloud_thickness=1.5):
@@ -46,3 +50,135 @@ def mark_signal(data, max_cloud_thickness=1.5):
     data.loc[within_cloud & real_turn_down & cross_down_base, 'sell'] = 1
     return data
 
+
+
+IkhLines = collections.namedtuple('IkhLines', ['price', 'base', 'turn', 'cloud1', 'cloud2', 'buy', 'sell'])
+
+
+class IkhStream(object):
+    """
+    Incremental lines_data and mark_signal, for live bars: update takes one
+    new price and returns the latest row of mark_signal(lines_data(prices))
+    in O(1), without the lag line. The lag of the row displacement periods
+    back is the new price itself.
+
+    Parameters
+    ----------
+    turn, base, lag_span, displacement : int
+        As in lines_data
+    max_cloud_thickness : float
+        As in mark_signal, where it isn't used either
+    """
+
+    def __init__(self, turn=9, base=26, lag_span=52, displacement=26, max_cloud_thickness=1.5):
+        self.max_cloud_thickness = max_cloud_thickness
+        self._turn = RollingMinMax(turn)
+        self._base = RollingMinMax(base)
+        self._lag_span = RollingMinMax(lag_span)
+        nans = [float('nan')] * displacement
+        self._cloud1 = collections.deque(nans, maxlen=displacement + 1)
+        self._cloud2 = collections.deque(nans, maxlen=displacement + 1)
+        self._prev_base = float('nan')
+        self._prev_turn = float('nan')
+
+    def update(self, price):
+        """
+        Parameters
+        ----------
+        price : float
+
+        Returns
+        -------
+        IkhLines
+        """
+        for roll in (self._turn, self._base, self._lag_span):
+            roll.update(price)
+        base = self._base.mid
+        turn = self._turn.mid
+        self._cloud1.append((base + turn) / 2)
+        self._cloud2.append(self._lag_span.mid)
+        cloud1 = self._cloud1[0]
+        cloud2 = self._cloud2[0]
+
+        within_cloud = ((cloud1 - price) >= 0) != ((cloud2 - price) >= 0)
+
+        curr_base = price - base
+        curr_turn = price - turn
+        cross_up = (self._prev_turn < 0 < curr_turn) or (self._prev_base < 0 < curr_base)
+        cross_down = (self._prev_turn > 0 > curr_turn) or (self._prev_base > 0 > curr_base)
+        self._prev_base = curr_base
+        self._prev_turn = curr_turn
+
+        buy = int(within_cloud and turn < price and cross_up)
+        sell = int(within_cloud and turn > price and cross_down)
+        return IkhLines(price, base, turn, cloud1, cloud2, buy, sell)
+
+
+IkhArrays = collections.namedtuple('IkhArrays', ['base', 'turn', 'lag', 'cloud1', 'cloud2', 'buy', 'sell'])
+
+
+def lines_arrays(prices, turn=9, base=26, lag_span=52, displacement=26, max_cloud_thickness=1.5,
+                 backend=None):
+    """
+    Batched lines_data and mark_signal, on a (time x instrument) array such
+    as SqlMinuteReader.load_raw_arrays returns, all columns at once.
+
+    Parameters
+    ----------
+    prices : np.ndarray
+        1-D or 2-D, one column per instrument
+    turn, base, lag_span, displacement : int
+        As in lines_data
+    max_cloud_thickness : float
+        As in mark_signal, where it isn't used either
+    backend : str
+        As in lines_data
+
+    Returns
+    -------
+    IkhArrays
+        float64 lines and bool buy/sell masks, each shaped like prices,
+        equal to the columns of mark_signal(lines_data(...)) per instrument
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    base_line = _mid(prices, base, backend)
+    turn_line = _mid(prices, turn, backend)
+    lag = _shift(prices, -displacement)
+    cloud1 = _shift((base_line + turn_line) / 2, displacement)
+    cloud2 = _shift(_mid(prices, lag_span, backend), displacement)
+
+    buy, sell = _signal_masks(prices, base_line, turn_line, cloud1, cloud2)
+    return IkhArrays(base_line, turn_line, lag, cloud1, cloud2, buy, sell)
+
+
+def _signal_masks(prices, base_line, turn_line, cloud1, cloud2):
+    """ mark_signal's buy and sell conditions, on arrays that broadcast together """
+    with np.errstate(invalid='ignore'):
+        within_cloud = ((cloud1 - prices) >= 0) != ((cloud2 - prices) >= 0)
+        curr_base = prices - base_line
+        prev_base = _shift(curr_base, 1)
+        curr_turn = prices - turn_line
+        prev_turn = _shift(curr_turn, 1)
+
+        buy = within_cloud & (turn_line < prices) & (((prev_turn < 0) & (curr_turn > 0)) |
+                                                     ((prev_base < 0) & (curr_base > 0)))
+        sell = within_cloud & (turn_line > prices) & (((prev_turn > 0) & (curr_turn < 0)) |
+                                                      ((prev_base > 0) & (curr_base < 0)))
+    return buy, sell
+
+
+def _mid(prices, window, backend=None):
+    mins, maxs = rolling_min_max(prices, window, backend)
+    return (mins + maxs) / 2.0
+
+
+def _shift(values, periods):
+    """ Like pandas' shift along the rows, filling with NaN """
+    shifted = np.full(values.shape, np.nan)
+    if periods == 0:
+        shifted[:] = values
+    elif periods > 0:
+        shifted[periods:] = values[:-periods]
+    else:
+        shifted[:periods] = values[-periods:]
+    return shifted
@@ -0,0 +1,171 @@
+"""
+Rolling window extrema
+"""
+import collections
+import numpy as np
+import pandas as pd
+
+BACKENDS = ('pandas', 'numpy', 'deque')
+
+# Size (rows x columns) up to which rolling_min_max picks the numpy
+# backend. It is faster than pandas at every size, but its temporaries take
+# about 6 times the input, so past this pandas is picked instead.
+# benchmarks/bench_rolling.py measures both.
+NUMPY_MAX_SIZE = 10000000
+
+
+class RollingMinMax(object):
+    """
+    Min and max of the last `window` values of a stream, in amortized O(1)
+    per value, using monotonic deques of (position, value).
+
+    Like pandas' rolling(window).min()/max(), both are NaN until `window`
+    values have been seen, and while a NaN is within the window.
+
+    Parameters
+    ----------
+    window : int
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self._mins = collections.deque()
+        self._maxs = collections.deque()
+        self._last_nan = -window
+
+    def update(self, value):
+        position = self.count
+        self.count += 1
+
+        if value != value:
+            self._last_nan = position
+        else:
+            mins = self._mins
+            while mins and mins[-1][1] >= value:
+                mins.pop()
+            mins.append((position, value))
+
+            maxs = self._maxs
+            while maxs and maxs[-1][1] <= value:
+                maxs.pop()
+            maxs.append((position, value))
+
+        expired = position - self.window
+        if self._mins and self._mins[0][0] <= expired:
+            self._mins.popleft()
+        if self._maxs and self._maxs[0][0] <= expired:
+            self._maxs.popleft()
+
+    @property
+    def ready(self):
+        return self.count >= self.window and self._last_nan <= self.count - 1 - self.window
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self.ready else float('nan')
+
+    @property
+    def max(self):
+        return self._maxs[0][1] if self.ready else float('nan')
+
+    @property
+    def mid(self):
+        """ (min + max) / 2, the Ichimoku line of the window """
+        if not self.ready:
+            return float('nan')
+        return (self._mins[0][1] + self._maxs[0][1]) / 2.0
+
+
+def pick_backend(size):
+    """ The rolling_min_max backend used for inputs of size values """
+    return 'numpy' if size <= NUMPY_MAX_SIZE else 'pandas'
+
+
+def rolling_min_max(values, window, backend=None):
+    """
+    Rolling min and max over the rows of a 1-D or 2-D array, with a choice
+    of implementation. All give the same results as pandas'
+    rolling(window).min()/max().
+
+    Parameters
+    ----------
+    values : np.ndarray
+    window : int
+    backend : str
+        'pandas', 'numpy' (rolling_extrema) or 'deque' (RollingMinMax,
+        one value at a time, as used on streams). Picked by pick_backend
+        if None.
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Rolling min and max, float64, shaped like values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if backend is None:
+        backend = pick_backend(values.size)
+
+    if backend == 'numpy':
+        return rolling_extrema(values, window)
+
+    if backend == 'pandas':
+        roll = (pd.DataFrame(values) if values.ndim == 2 else pd.Series(values)).rolling(window)
+        return roll.min().values, roll.max().values
+
+    if backend == 'deque':
+        mins = np.empty(values.shape)
+        maxs = np.empty(values.shape)
+        columns = values.reshape(len(values), -1)
+        for column in range(columns.shape[1]):
+            roll = RollingMinMax(window)
+            column_mins = mins.reshape(columns.shape)[:, column]
+            column_maxs = maxs.reshape(columns.shape)[:, column]
+            for row, value in enumerate(columns[:, column].tolist()):
+                roll.update(value)
+                column_mins[row] = roll.min
+                column_maxs[row] = roll.max
+        return mins, maxs
+
+    raise ValueError('Unknown rolling backend {}, pick one of {}'.format(backend, ', '.join(BACKENDS)))
+
+
+def rolling_extrema(values, window):
+    """
+    Rolling min and max over the rows of a 1-D or 2-D (time x instrument)
+    array, like pandas' rolling(window).min()/max() on every column at
+    once: the first window - 1 rows are NaN, as are windows holding a NaN.
+
+    Uses the van Herk/Gil-Werman algorithm: rows are cut in blocks of
+    window rows, and each window is the union of a block suffix and the
+    next block prefix, so the work is O(rows x columns) whatever the window.
+
+    Parameters
+    ----------
+    values : np.ndarray
+    window : int
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Rolling min and max, float64, shaped like values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rows = len(values)
+    if window < 1 or rows < window:
+        return np.full(values.shape, np.nan), np.full(values.shape, np.nan)
+
+    blocks = -(-rows // window)
+    padding = np.full((blocks * window - rows,) + values.shape[1:], np.nan)
+    blocked = np.concatenate([values, padding]).reshape((blocks, window) + values.shape[1:])
+    return (_rolling_reduce(blocked, rows, window, np.minimum),
+            _rolling_reduce(blocked, rows, window, np.maximum))
+
+
+def _rolling_reduce(blocked, rows, window, ufunc):
+    shape = (-1,) + blocked.shape[2:]
+    prefix = ufunc.accumulate(blocked, axis=1).reshape(shape)
+    suffix = ufunc.accumulate(blocked[:, ::-1], axis=1)[:, ::-1].reshape(shape)
+    result = np.full((rows,) + blocked.shape[2:], np.nan)
+    ufunc(suffix[:rows - window + 1], prefix[window - 1:rows], out=result[window - 1:])
+    return result
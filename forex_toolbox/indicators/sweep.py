@@ -0,0 +1,129 @@
+"""
+Ichimoku parameter sweeps: evaluates ikh signals for a whole grid of
+lines_data/mark_signal parameters, computing the rolling mid of each
+distinct window once for all of them.
+"""
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from . import ikh
+
+PARAMETERS = ['turn', 'base', 'lag_span', 'displacement', 'max_cloud_thickness']
+DEFAULTS = {'turn': 9, 'base': 26, 'lag_span': 52, 'displacement': 26, 'max_cloud_thickness': 1.5}
+
+# Set in each process by _init_worker: (prices, {window: rolling mid})
+_shared = None
+
+
+def parameter_grid(**values):
+    """
+    Every combination of the given parameter values, the others keeping
+    the lines_data/mark_signal defaults, e.g.
+
+        parameter_grid(turn=[7, 9], base=range(20, 30))
+
+    Returns
+    -------
+    list of dict
+    """
+    unknown = set(values) - set(PARAMETERS)
+    if unknown:
+        raise ValueError('Unknown ikh parameters: {}'.format(', '.join(sorted(unknown))))
+    names = [name for name in PARAMETERS if name in values]
+    grid = []
+    for combination in itertools.product(*[values[name] for name in names]):
+        params = dict(DEFAULTS)
+        params.update(zip(names, combination))
+        grid.append(params)
+    return grid
+
+
+def sweep(prices, grid, processes=1, chunksize=64):
+    """
+    Counts the buy and sell signals of mark_signal(lines_data(prices, ...))
+    for every parameter set of grid.
+
+    Rolling mids are computed once per distinct window, and parameter sets
+    are evaluated chunksize at a time as (time x chunksize) arrays. Sets
+    only differing by max_cloud_thickness, which mark_signal doesn't use,
+    are evaluated once.
+
+    Parameters
+    ----------
+    prices : pd.Series or np.ndarray
+        1-D prices of one instrument
+    grid : list of dict
+        Parameter sets, e.g. from parameter_grid. Missing parameters take
+        the defaults.
+    processes : int
+        Chunks are spread across a multiprocessing.Pool of that many
+        processes when more than 1
+    chunksize : int
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per parameter set, in grid order: the parameters, then the
+        number of 'buys' and 'sells'
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    table = pd.DataFrame([dict(DEFAULTS, **params) for params in grid], columns=PARAMETERS)
+    keys = [tuple(int(value) for value in row)
+            for row in table[['turn', 'base', 'lag_span', 'displacement']].values]
+    distinct = sorted(set(keys))
+
+    windows = set()
+    for turn, base, lag_span, _ in distinct:
+        windows.update([turn, base, lag_span])
+    mids = dict((window, ikh._mid(prices, window)) for window in windows)
+
+    chunks = [distinct[i:i + chunksize] for i in range(0, len(distinct), chunksize)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(prices, mids))
+        try:
+            counts = list(pool.imap(_sweep_chunk, chunks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(prices, mids)
+        try:
+            counts = [_sweep_chunk(chunk) for chunk in chunks]
+        finally:
+            _init_worker(None, None)
+
+    buys, sells = {}, {}
+    for chunk, (chunk_buys, chunk_sells) in zip(chunks, counts):
+        buys.update(zip(chunk, chunk_buys))
+        sells.update(zip(chunk, chunk_sells))
+    table['buys'] = [buys[key] for key in keys]
+    table['sells'] = [sells[key] for key in keys]
+    return table
+
+
+def _init_worker(prices, mids):
+    global _shared
+    _shared = None if prices is None else (prices, mids)
+
+
+def _sweep_chunk(chunk):
+    """ buy and sell counts of each (turn, base, lag_span, displacement) of chunk """
+    prices, mids = _shared
+    turn_lines = np.column_stack([mids[turn] for turn, _, _, _ in chunk])
+    base_lines = np.column_stack([mids[base] for _, base, _, _ in chunk])
+    lag_span_lines = np.column_stack([mids[lag_span] for _, _, lag_span, _ in chunk])
+    displacements = np.array([displacement for _, _, _, displacement in chunk])
+
+    cloud1 = _shift_columns((base_lines + turn_lines) / 2, displacements)
+    cloud2 = _shift_columns(lag_span_lines, displacements)
+    buy, sell = ikh._signal_masks(prices[:, np.newaxis], base_lines, turn_lines, cloud1, cloud2)
+    return buy.sum(axis=0), sell.sum(axis=0)
+
+
+def _shift_columns(values, periods):
+    """ Shifts each column of values down by its own number of periods, filling with NaN """
+    rows = np.arange(len(values))[:, np.newaxis] - periods
+    shifted = values[np.maximum(rows, 0), np.arange(values.shape[1])]
+    shifted[rows < 0] = np.nan
+    return shifted
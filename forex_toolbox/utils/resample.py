@@ -6,7 +6,19 @@ Convert other format into ohlc bars
 import pandas as pd
 
 
-def bid_ask_to_ohlc(path):
+DEFAULT_CHUNKSIZE = 1000000
+
+# e.g. 20160729 20:50:12.065
+TRUEFX_DATETIME_WIDTH = 21
+TRUEFX_DATETIME_SEPARATORS = ((8, ' '), (11, ':'), (14, ':'), (17, '.'))
+
+OHLC_COLUMNS = ['open', 'high', 'low', 'close']
+SPREAD_COLUMNS = ['bid_open', 'bid_high', 'bid_low', 'bid_close',
+                  'ask_open', 'ask_high', 'ask_low', 'ask_close',
+                  'spread_mean', 'spread_max', 'spread_last']
+
+
+def bid_ask_to_ohlc(path, chunksize=None, fast_dates=False, spreads=False):
     """
     CSV downloaded from truefx comes in the following format:
         EUR/USD,20160729 20:59:56.418,1.11712,1.11781
@@ -16,52 +28,471 @@ def bid_ask_to_ohlc(path):
 
     Parameters
     ----------
-    path : str
+    path : str or file-like
         Path to bid/ask csv data
+    chunksize : int, optional
+        If given, ticks are read and resampled chunksize rows at a time
+        (see iter_bid_ask_ohlc), so only the bars are held in memory.
+    fast_dates : bool
+        If true, datetimes are parsed with parse_truefx_datetimes instead
+        of pandas' generic parser. Much faster, but only for the fixed
+        width truefx layout.
+    spreads : bool
+        If true, bars also have the SPREAD_COLUMNS, see spread_bars
 
     Returns
     -------
     ohlc     : the dataframe containing minute bar data
     """
-    df = pd.read_csv(path,
-                     header=None,
-                     names=['name', 'datetime', 'bid', 'ask'],
-                     parse_dates=[1])
-    df.set_index('datetime', inplace=True)
-    df['mid'] = (df['bid']*100000 + df['ask']*100000) // 2
-    ohlcv = df.mid.resample('1Min').ohlc()
-    ohlcv['volume'] = df.mid.resample('1Min').count()
-    ohlcv.index = ohlcv.index.tz_localize('UTC')
-    return ohlcv
-
-
-def range_bars(prices, pips=5, pip_size=1e-4):
-    int_prices = (prices / pip_size).round(0).astype(int)
-    range_bars = [0]
-    current_level = int_prices[0]
-
-    for price in int_prices:
-        change = price - current_level
-        while change > pips:
-            range_bars.append(1)
-            change -= pips + 1
-            current_level += pips + 1
-        while change < -pips:
-            range_bars.append(0)
-            change += pips + 1
-            current_level -= pips + 1
-
-    return pd.Series(range_bars[1:])
+    return bid_ask_to_bars(path, ('1Min',), chunksize, fast_dates, spreads)['1Min']
+
+
+def bid_ask_to_bars(path, widths=('1Min',), chunksize=None, fast_dates=False, spreads=False):
+    """
+    Like bid_ask_to_ohlc, but builds bars of several widths from a single
+    read of the csv.
+
+    Parameters
+    ----------
+    path : str or file-like
+        Path to bid/ask csv data
+    widths : iterable
+        Bar widths, anything pd.Timedelta accepts, e.g. '5s', '1Min'. Each
+        must divide a day, and the widest.
+    chunksize : int, optional
+        If given, ticks are read and resampled chunksize rows at a time
+    fast_dates : bool
+        If true, datetimes are parsed with parse_truefx_datetimes
+    spreads : bool
+        If true, bars also have the SPREAD_COLUMNS, see spread_bars
+
+    Returns
+    -------
+    dict of width -> ohlcv dataframe
+    """
+    if chunksize is not None:
+        chunks = list(iter_bid_ask_bars(path, widths, chunksize, fast_dates, spreads))
+        if not chunks:
+            empty = [np.empty(0, dtype=np.int64)] * (4 if spreads else 2)
+            return {width: _bars(empty, width) for width in widths}
+        return {width: pd.concat([bars[width] for bars in chunks]) for width in widths}
+
+    ticks = _sorted(_ticks(_read_ticks(path, fast_dates), fast_dates, spreads))
+    return {width: _bars(ticks, width) for width in widths}
+
+
+def iter_bid_ask_ohlc(path, chunksize=DEFAULT_CHUNKSIZE, fast_dates=False, spreads=False):
+    """
+    Streaming version of bid_ask_to_ohlc. Reads the csv chunksize rows at
+    a time and yields minute bars as soon as they are complete. Ticks of
+    the last (possibly unfinished) minute of a chunk are carried over to
+    the next one, so peak memory is bounded by chunksize regardless of
+    the file size.
+
+    Ticks are expected in chronological order, as truefx files are. They
+    are sorted within a chunk, but a tick earlier than bars already yielded
+    raises a ValueError, those files need chunksize=None.
+
+    Parameters
+    ----------
+    path : str or file-like
+        Path to bid/ask csv data
+    chunksize : int
+        Number of csv rows read at a time
+    fast_dates : bool
+        If true, datetimes are parsed with parse_truefx_datetimes
+    spreads : bool
+        If true, bars also have the SPREAD_COLUMNS, see spread_bars
+
+    Returns
+    -------
+    Yield ohlc dataframes, concatenating to the same bars as
+    bid_ask_to_ohlc
+    """
+    for bars in iter_bid_ask_bars(path, ('1Min',), chunksize, fast_dates, spreads):
+        yield bars['1Min']
+
+
+def iter_bid_ask_bars(path, widths=('1Min',), chunksize=DEFAULT_CHUNKSIZE, fast_dates=False,
+                      spreads=False):
+    """
+    Streaming version of bid_ask_to_bars, see iter_bid_ask_ohlc. Ticks of
+    the last bar of the widest width are carried over to the next chunk.
+
+    Returns
+    -------
+    Yield dicts of width -> ohlcv dataframe
+    """
+    nanos = {width: pd.Timedelta(width).value for width in widths}
+    widest = max(nanos.values())
+
+    reader = _read_ticks(path, fast_dates, chunksize=chunksize)
+    carry = None
+    yielded_until = None
+    next_bar = dict.fromkeys(widths)
+    for chunk in reader:
+        ticks = _ticks(chunk, fast_dates, spreads)
+        if carry is not None:
+            ticks = [np.concatenate([left, right]) for left, right in zip(carry, ticks)]
+        ticks = _sorted(ticks)
+        timestamps = ticks[0]
+        if len(timestamps) == 0:
+            continue
+        if yielded_until is not None and timestamps[0] < yielded_until:
+            raise ValueError('Tick at {} is earlier than bars already yielded, ticks are too far out of order '
+                             'to be resampled by chunks'.format(pd.Timestamp(timestamps[0])))
+
+        # The last bar of the chunk may continue in the next one
+        yielded_until = timestamps[-1] // widest * widest
+        done = np.searchsorted(timestamps, yielded_until)
+        carry = [column[done:] for column in ticks]
+        if done:
+            bars = {}
+            for width in widths:
+                bars[width] = _bars([column[:done] for column in ticks], width, next_bar[width])
+                next_bar[width] = bars[width].index[-1].value + nanos[width]
+            yield bars
+
+    if carry is not None and len(carry[0]):
+        yield {width: _bars(carry, width, next_bar[width]) for width in widths}
+
+
+def ohlcv_bars(timestamps, prices, width='1Min', start=None):
+    """
+    Aggregates ticks into open, high, low, close, volume (tick count) bars
+    in a single pass: ticks are grouped on bar boundaries, and each field
+    is one reduction over the groups.
+
+    Gives the same bars as prices.resample(width).ohlc() along with
+    .resample(width).count(), including the empty bars in between, which
+    have NaN prices and 0 volume.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray of int64
+        Nanoseconds since epoch, UTC, sorted
+    prices : np.ndarray
+        Tick prices, e.g. integer mid prices
+    width : str or pd.Timedelta
+        Bar width, must divide a day
+    start : int, optional
+        Nanoseconds since epoch of the first bar. Empty bars are prepended
+        up to the first tick, so that consecutive calls line up.
+
+    Returns
+    -------
+    ohlcv : pd.DataFrame
+        Indexed by UTC bar start
+    """
+    groups = _BarGroups(timestamps, width, start)
+    df = pd.DataFrame(groups.ohlc(prices), index=groups.index, columns=OHLC_COLUMNS)
+    df['volume'] = groups.count()
+    return df
+
+
+def spread_bars(timestamps, mid, bid, ask, width='1Min', start=None):
+    """
+    Like ohlcv_bars on the mid prices, plus the bid and ask ohlc, and the
+    mean, max and last spread (ask - bid) of every bar, all from the same
+    grouping of the ticks.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray of int64
+        Nanoseconds since epoch, UTC, sorted
+    mid, bid, ask : np.ndarray
+        Tick prices, e.g. integer prices in 1e-5 units
+    width : str or pd.Timedelta
+        Bar width, must divide a day
+    start : int, optional
+        Nanoseconds since epoch of the first bar, see ohlcv_bars
+
+    Returns
+    -------
+    pd.DataFrame
+        With columns open, high, low, close, volume and SPREAD_COLUMNS
+    """
+    groups = _BarGroups(timestamps, width, start)
+    spread = ask - bid
+    values = np.hstack([groups.ohlc(mid),
+                        groups.ohlc(bid),
+                        groups.ohlc(ask),
+                        groups.mean(spread),
+                        groups.reduce(np.maximum, spread),
+                        groups.take(spread, last=True)])
+    df = pd.DataFrame(values, index=groups.index,
+                      columns=OHLC_COLUMNS + SPREAD_COLUMNS)
+    df.insert(4, 'volume', groups.count())
+    return df
+
+
+class _BarGroups(object):
+    """
+    Groups of sorted ticks falling into the same bar, shared by every
+    field computed for those bars. Bars without ticks are NaN.
+    """
+
+    def __init__(self, timestamps, width, start=None):
+        self.width = pd.Timedelta(width).value
+        if not len(timestamps):
+            self.starts = self.ends = self.rows = np.empty(0, dtype=np.int64)
+            self.size = 0
+            self.index = pd.DatetimeIndex([], tz='UTC', name='datetime')
+            return
+        bins = timestamps // self.width
+        first = bins[0] if start is None else min(bins[0], start // self.width)
+
+        # position of the first tick of every non-empty bar
+        self.starts = np.concatenate([[0], np.flatnonzero(np.diff(bins)) + 1])
+        self.ends = np.concatenate([self.starts[1:], [len(bins)]])
+        self.rows = bins[self.starts] - first
+        self.size = bins[-1] - first + 1
+        self.index = pd.date_range(pd.Timestamp(first * self.width, tz='UTC'),
+                                   periods=self.size,
+                                   freq=pd.Timedelta(self.width),
+                                   name='datetime')
+
+    def count(self):
+        count = np.zeros(self.size, dtype=np.int64)
+        count[self.rows] = self.ends - self.starts
+        return count
+
+    def ohlc(self, prices):
+        return np.hstack([self.take(prices),
+                          self.reduce(np.maximum, prices),
+                          self.reduce(np.minimum, prices),
+                          self.take(prices, last=True)])
+
+    def take(self, values, last=False):
+        column = np.full((self.size, 1), np.nan)
+        if self.size:
+            column[self.rows, 0] = values[self.ends - 1 if last else self.starts]
+        return column
+
+    def mean(self, values):
+        column = np.full((self.size, 1), np.nan)
+        if self.size:
+            column[self.rows, 0] = np.add.reduceat(values, self.starts) / (self.ends - self.starts)
+        return column
+
+    def reduce(self, ufunc, values):
+        column = np.full((self.size, 1), np.nan)
+        if self.size:
+            column[self.rows, 0] = ufunc.reduceat(values, self.starts)
+        return column
+
+
+def parse_truefx_datetimes(values):
+    """
+    Parses truefx datetimes in bulk. They are fixed width, e.g.
+    '20160729 20:50:12.065', so every field is read straight off its
+    character positions, with no format inference.
+
+    Parameters
+    ----------
+    values : array-like of str
+
+    Returns
+    -------
+    np.ndarray of int64
+        Nanoseconds since epoch, UTC. Falls back to pd.to_datetime when
+        any value doesn't follow the layout.
+    """
+    # One extra byte, to tell values longer than the layout
+    chars = np.asarray(values, dtype='S{}'.format(TRUEFX_DATETIME_WIDTH + 1))
+    chars = chars.view(np.uint8).reshape(-1, TRUEFX_DATETIME_WIDTH + 1)
+    layout_ok = (chars[:, -1] == 0).all() and (chars[:, -2] != 0).all()
+    for position, separator in TRUEFX_DATETIME_SEPARATORS:
+        layout_ok = layout_ok and (chars[:, position] == ord(separator)).all()
+    if not layout_ok:
+        return pd.to_datetime(values).values.astype('datetime64[ns]').astype(np.int64)
+
+    def field(start, stop):
+        # digits are accumulated as their ascii codes, '0' offsets removed once
+        number = np.zeros(len(chars), dtype=np.int32)
+        for position in range(start, stop):
+            number *= 10
+            number += chars[:, position]
+        number -= ord('0') * int('1' * (stop - start))
+        return number.astype(np.int64)
+
+    year, month, day = field(0, 4), field(4, 6), field(6, 8)
+
+    # days since epoch of a proleptic gregorian date, see
+    # http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+
+    seconds = days * 86400 + field(9, 11) * 3600 + field(12, 14) * 60 + field(15, 17)
+    return (seconds * 1000 + field(18, 21)) * 1000000
+
+
+def _read_ticks(path, fast_dates, chunksize=None):
+    """ Reads a truefx csv, or an iterator of chunks of it if chunksize is given """
+    return pd.read_csv(path,
+                       header=None,
+                       names=['name', 'datetime', 'bid', 'ask'],
+                       parse_dates=False if fast_dates else [1],
+                       chunksize=chunksize)
+
+
+def _ticks(df, fast_dates=False, spreads=False):
+    """
+    Returns
+    -------
+    [timestamps, mid] or [timestamps, mid, bid, ask] if spreads
+        int64 nanoseconds since epoch, and integer prices in 1e-5 units
+    """
+    if fast_dates:
+        timestamps = parse_truefx_datetimes(df['datetime'].values)
+    else:
+        timestamps = df['datetime'].values.astype('datetime64[ns]').view(np.int64)
+    bid = df['bid'].values*100000
+    ask = df['ask'].values*100000
+    ticks = [timestamps, ((bid + ask) // 2).astype(np.int64)]
+    if spreads:
+        ticks += [np.rint(bid).astype(np.int64), np.rint(ask).astype(np.int64)]
+    return ticks
+
+
+def _sorted(ticks):
+    """ _ticks output in chronological order, ticks of the same time keeping theirs """
+    timestamps = ticks[0]
+    if (timestamps[1:] >= timestamps[:-1]).all():
+        return ticks
+    order = np.argsort(timestamps, kind='mergesort')
+    return [column[order] for column in ticks]
+
+
+def _bars(ticks, width, start=None):
+    """ ohlcv_bars or spread_bars of _ticks output """
+    if len(ticks) == 4:
+        return spread_bars(ticks[0], ticks[1], ticks[2], ticks[3], width, start)
+    return ohlcv_bars(ticks[0], ticks[1], width, start)
+
+
+def range_bars(prices, pips=5, pip_size=1e-4, return_times=False):
+    """
+    Range bars of pips size: a bar is up (1) each time the price rises
+    pips + 1 pips above the last bar's level, down (0) each time it falls
+    pips + 1 pips below it.
+
+    The bar level only moves in steps of pips + 1 from the first price,
+    and after each price it is the level closest to its previous value
+    within pips of that price. So every price clamps the level between
+    two bounds, and a run of clamps composes into a single clamp. The
+    levels after every price come from a prefix scan of those
+    compositions, in vectorized passes of doubling offsets. Prices whose
+    bounds contain the previous price's bounds can't move the level and
+    are dropped beforehand, and passes only touch the prices whose level
+    is still undecided.
+
+    Parameters
+    ----------
+    prices : pd.Series
+    pips : int
+    pip_size : float
+    return_times : bool
+        If true, also returns the index label of the price at which each
+        bar completed
+
+    Returns
+    -------
+    bars : pd.Series of 1 (up) and 0 (down)
+    completed_at : pd.Series, only if return_times
+    """
+    int_prices = (prices / pip_size).round(0).astype(int).values.astype(np.int64)
+    step = pips + 1
+    if len(int_prices) == 0:
+        bars = pd.Series([], dtype=np.int64)
+        return (bars, pd.Series(prices.index[:0])) if return_times else bars
+
+    # bounds of the level, in steps from the first price, after each price
+    change = int_prices - int_prices[0]
+    low = -((pips - change) // step)
+    high = (change + pips) // step
+
+    # the level can only move at prices narrowing the previous bounds
+    positions = np.flatnonzero(np.concatenate([[True], (low[1:] > low[:-1]) | (high[1:] < high[:-1])]))
+    low, high = low[positions], high[positions]
+
+    # a composed clamp is final once it pins a single level, or once it
+    # reaches back to the first price
+    offset = 1
+    undecided = np.flatnonzero(low != high)
+    undecided = undecided[undecided >= offset]
+    while len(undecided):
+        earlier = undecided - offset
+        composed_low = np.minimum(np.maximum(low[earlier], low[undecided]), high[undecided])
+        high[undecided] = np.minimum(np.maximum(high[earlier], low[undecided]), high[undecided])
+        low[undecided] = composed_low
+        offset *= 2
+        undecided = undecided[(low[undecided] != high[undecided]) & (undecided >= offset)]
+
+    levels = np.minimum(np.maximum(0, low), high)
+    moves = np.diff(np.concatenate([[0], levels]))
+    counts = np.abs(moves)
+
+    bars = pd.Series(np.repeat((moves > 0).astype(np.int64), counts))
+    if return_times:
+        return bars, pd.Series(np.repeat(prices.index.values[positions], counts))
+    return bars
 
 
 def collapse(input_bars):
-    bars = input_bars.copy()
-    bars[bars==0] = -1
-    res = np.array([1])
-    for x in bars:
-        if x ^ res[-1] >= 0:
-            res[-1] += x
-        else:
-            res = np.append(res, x)
-    res[0] = 0
-    return res
+    """
+    Run length encodes range bars: each run of up bars (1) becomes its
+    length, each run of down bars (0) its negated length. The first
+    element is always 0, and an opening run of up bars is folded into it.
+
+    Parameters
+    ----------
+    input_bars : pd.Series or np.ndarray
+        As returned by range_bars
+
+    Returns
+    -------
+    np.ndarray of int
+    """
+    return extend_collapsed(np.zeros(1, dtype=np.int64), input_bars)
+
+
+def extend_collapsed(collapsed, new_bars):
+    """
+    Streaming version of collapse: extends an already collapsed series with
+    newly completed range bars, so that
+
+        extend_collapsed(collapse(bars[:i]), bars[i:]) == collapse(bars)
+
+    Parameters
+    ----------
+    collapsed : np.ndarray
+        As returned by collapse or extend_collapsed. Not modified.
+    new_bars : pd.Series or np.ndarray
+        Range bars completed since
+
+    Returns
+    -------
+    np.ndarray of int
+    """
+    result = np.array(collapsed, dtype=np.int64)
+    bars = np.array(new_bars, dtype=np.int64)
+    if len(bars) == 0:
+        return result
+    bars[bars == 0] = -1
+
+    # one sum per run of same signed bars
+    down = bars < 0
+    runs = np.add.reduceat(bars, np.concatenate([[0], np.flatnonzero(down[1:] != down[:-1]) + 1]))
+
+    if len(result) == 1:
+        if runs[0] > 0:
+            runs = runs[1:]
+    elif (runs[0] < 0) == (result[-1] < 0):
+        result[-1] += runs[0]
+        runs = runs[1:]
+    return np.concatenate([result, runs])
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import pandas as pd
 import pytz
 import datetime
@@ -14,6 +15,126 @@ def test_bid_ask_to_ohlc():
     assert df.index[0] == datetime.datetime(2016, 7, 29, 20, 50, 00, tzinfo=pytz.UTC)
 
 
+@pytest.mark.parametrize("chunksize", [1, 7, 500, 5000])
+def test_bid_ask_to_ohlc_chunked(chunksize):
+    path = 'fixtures/bid_ask.csv'
+    expected = resample.bid_ask_to_ohlc(path)
+    df = resample.bid_ask_to_ohlc(path, chunksize=chunksize)
+    assert (df.index == expected.index).all()
+    assert df.equals(expected)
+
+
+def test_iter_bid_ask_ohlc_yields_complete_minutes():
+    path = 'fixtures/bid_ask.csv'
+    chunks = list(resample.iter_bid_ask_ohlc(path, chunksize=100))
+    assert len(chunks) > 1
+    for prev, curr in zip(chunks, chunks[1:]):
+        assert curr.index[0] == prev.index[-1] + pd.Timedelta(minutes=1)
+
+
+def test_bid_ask_to_bars_chunked_sorts_within_chunks(tmpdir):
+    lines = open('fixtures/bid_ask.csv').read().splitlines()
+    lines[20], lines[30] = lines[30], lines[20]
+    path = str(tmpdir.join('bid_ask.csv'))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    expected = resample.bid_ask_to_bars(path, ['1s', '1Min'])
+    bars = resample.bid_ask_to_bars(path, ['1s', '1Min'], chunksize=300)
+    for width in ['1s', '1Min']:
+        assert bars[width].equals(expected[width])
+
+
+def test_iter_bid_ask_bars_rejects_ticks_before_yielded_bars(tmpdir):
+    lines = open('fixtures/bid_ask.csv').read().splitlines()
+    path = str(tmpdir.join('bid_ask.csv'))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines[1:] + lines[:1]) + '\n')
+
+    with pytest.raises(ValueError):
+        list(resample.iter_bid_ask_bars(path, ['1Min'], chunksize=100))
+
+
+@pytest.mark.parametrize("chunksize", [None, 100])
+def test_bid_ask_to_bars_empty_file(tmpdir, chunksize):
+    path = tmpdir.join('bid_ask.csv')
+    path.write('')
+
+    bars = resample.bid_ask_to_bars(str(path), ['1Min'], chunksize=chunksize, spreads=True)['1Min']
+    assert bars.empty
+    assert set(['open', 'high', 'low', 'close', 'volume']) <= set(bars.columns)
+    assert bars.index.tz.__str__() == 'UTC'
+
+
+@pytest.mark.parametrize("chunksize", [None, 300])
+def test_bid_ask_to_ohlc_fast_dates(chunksize):
+    path = 'fixtures/bid_ask.csv'
+    expected = resample.bid_ask_to_ohlc(path)
+    df = resample.bid_ask_to_ohlc(path, chunksize=chunksize, fast_dates=True)
+    assert df.equals(expected)
+
+
+def test_parse_truefx_datetimes():
+    values = np.array(['20160729 20:50:12.065',
+                       '20000229 23:59:59.999',
+                       '19700101 00:00:00.001'], dtype=object)
+    expected = pd.to_datetime(values).values.astype('datetime64[ns]').view(np.int64)
+    assert (resample.parse_truefx_datetimes(values) == expected).all()
+
+
+def test_parse_truefx_datetimes_other_layout():
+    values = np.array(['2016-07-29 20:50:12'], dtype=object)
+    expected = pd.to_datetime(values).values.astype('datetime64[ns]').view(np.int64)
+    assert (resample.parse_truefx_datetimes(values) == expected).all()
+
+
+@pytest.mark.parametrize("chunksize", [None, 300])
+def test_bid_ask_to_bars(chunksize):
+    path = 'fixtures/bid_ask.csv'
+    ticks = pd.read_csv(path, header=None, names=['name', 'datetime', 'bid', 'ask'],
+                        parse_dates=[1], index_col=1)
+    mid = (ticks['bid']*100000 + ticks['ask']*100000) // 2
+
+    widths = ['1s', '5s', '1Min', '5Min']
+    bars = resample.bid_ask_to_bars(path, widths, chunksize=chunksize, fast_dates=True)
+    for width in widths:
+        expected = mid.resample(width).ohlc()
+        expected['volume'] = mid.resample(width).count()
+        expected.index = expected.index.tz_localize('UTC')
+        assert bars[width].equals(expected)
+
+
+def test_ohlcv_bars_pads_from_start():
+    timestamps = pd.DatetimeIndex(['2016-07-29 20:52:10', '2016-07-29 20:52:50',
+                                   '2016-07-29 20:54:01']).values.astype('datetime64[ns]').view(np.int64)
+    prices = np.array([3, 1, 2])
+    start = pd.Timestamp('2016-07-29 20:50').value
+
+    bars = resample.ohlcv_bars(timestamps, prices, '1Min', start=start)
+    assert bars.index[0] == pd.Timestamp('2016-07-29 20:50', tz='UTC')
+    assert list(bars.volume) == [0, 0, 2, 0, 1]
+    assert list(bars.iloc[2][['open', 'high', 'low', 'close']]) == [3, 3, 1, 1]
+    assert bars.open.isnull().sum() == 3
+
+
+def test_bid_ask_to_ohlc_spreads():
+    path = 'fixtures/bid_ask.csv'
+    ticks = pd.read_csv(path, header=None, names=['name', 'datetime', 'bid', 'ask'],
+                        parse_dates=[1], index_col=1)
+    bid = (ticks['bid']*100000).round()
+    ask = (ticks['ask']*100000).round()
+    spread = ask - bid
+
+    df = resample.bid_ask_to_ohlc(path, chunksize=300, spreads=True)
+    assert list(df.columns) == ['open', 'high', 'low', 'close', 'volume'] + resample.SPREAD_COLUMNS
+    assert df[['open', 'high', 'low', 'close', 'volume']].equals(resample.bid_ask_to_ohlc(path))
+    assert (df.bid_high.values == bid.resample('1Min').max().values).all()
+    assert (df.ask_open.values == ask.resample('1Min').first().values).all()
+    assert df.spread_mean.values == pytest.approx(spread.resample('1Min').mean().values)
+    assert (df.spread_max.values == spread.resample('1Min').max().values).all()
+    assert (df.spread_last.values == spread.resample('1Min').last().values).all()
+
+
 def test_range_bars():
     expected = pd.read_csv("fixtures/range_3pips_for_m1_head.csv")['expected']
     candles = pd.read_csv("fixtures/m1.csv",
@@ -26,6 +147,18 @@ def test_range_bars():
     assert (expected.iloc[0:10] == range_candles[0:10]).all()
 
 
+def test_range_bars_completion_times():
+    prices = pd.Series([1.1000, 1.1004, 1.1008, 1.1005, 1.1003, 1.0994],
+                       index=pd.date_range('2016-09-01', periods=6, freq='1Min'))
+
+    range_candles, completed_at = resample.range_bars(prices, pips=3, pip_size=1e-4,
+                                                      return_times=True)
+
+    assert list(range_candles) == [1, 1, 0, 0, 0]
+    assert list(completed_at) == [prices.index[1], prices.index[2],
+                                  prices.index[4], prices.index[5], prices.index[5]]
+
+
 def test_collapse():
     expected = pd.read_csv("fixtures/collapsed_range_3pips_for_m1_head.csv")['expected']
     candles = pd.read_csv("fixtures/m1.csv",
@@ -37,3 +170,17 @@ def test_collapse():
     collapsed = resample.collapse(range_candles[0:14])
 
     assert (expected == collapsed).all()
+
+
+def test_collapse_leading_runs():
+    assert list(resample.collapse(np.array([]))) == [0]
+    assert list(resample.collapse(np.array([1, 1, 0, 0, 0, 1]))) == [0, -3, 1]
+    assert list(resample.collapse(np.array([0, 1, 1, 0]))) == [0, -1, 2, -1]
+
+
+@pytest.mark.parametrize("split", [0, 1, 2, 3, 5, 8])
+def test_extend_collapsed(split):
+    bars = pd.Series([1, 1, 0, 0, 1, 0, 1, 1])
+    collapsed = resample.collapse(bars[:split])
+    extended = resample.extend_collapsed(collapsed, bars[split:])
+    assert list(extended) == list(resample.collapse(bars))
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import pandas as pd
 from ..forex_toolbox.indicators.ikh import *
 
@@ -28,3 +29,35 @@ def test_lines_data():
 
     assert len(ikh_lines.cloud1.dropna()) == total_periods - 52 + 1 # 26 periods ahead
     assert len(ikh_lines.cloud2.dropna()) == total_periods - 52 + - 26 + 1
+
+
+def test_ikh_stream_matches_batch():
+    price = pd.read_csv("fixtures/ikh_price.csv").price
+    expected = mark_signal(lines_data(price))
+
+    stream = IkhStream()
+    rows = pd.DataFrame([stream.update(p) for p in price], columns=IkhLines._fields)
+    for column in IkhLines._fields:
+        assert rows[column].equals(expected[column].astype(rows[column].dtype)), column
+    assert rows.buy.sum() > 0
+    assert rows.sell.sum() > 0
+
+
+def test_lines_arrays_matches_per_instrument():
+    price = pd.read_csv("fixtures/ikh_price.csv").price
+    prices = np.column_stack([price.values, price.values[::-1]])
+    lines = lines_arrays(prices)
+
+    for column in range(prices.shape[1]):
+        expected = mark_signal(lines_data(pd.Series(prices[:, column])))
+        for name in ['base', 'turn', 'lag', 'cloud1', 'cloud2']:
+            np.testing.assert_array_equal(getattr(lines, name)[:, column], expected[name].values)
+        np.testing.assert_array_equal(lines.buy[:, column], expected.buy.values == 1)
+        np.testing.assert_array_equal(lines.sell[:, column], expected.sell.values == 1)
+
+
+@pytest.mark.parametrize("backend", ['numpy', 'deque'])
+def test_lines_data_backends(backend):
+    price = pd.read_csv("fixtures/ikh_price.csv").price
+    expected = lines_data(price, backend='pandas')
+    assert lines_data(price, backend=backend).equals(expected)
@@ -0,0 +1,43 @@
+import pytest
+import numpy as np
+import pandas as pd
+from ..forex_toolbox.indicators.rolling import BACKENDS, RollingMinMax, rolling_extrema, rolling_min_max
+
+
+def test_rolling_min_max_matches_pandas():
+    prices = pd.Series(np.random.RandomState(0).randn(500).cumsum())
+    prices[[100, 101, 300]] = np.nan
+    roll = RollingMinMax(26)
+    mins, maxs = [], []
+    for price in prices:
+        roll.update(price)
+        mins.append(roll.min)
+        maxs.append(roll.max)
+    assert pd.Series(mins).equals(prices.rolling(26).min())
+    assert pd.Series(maxs).equals(prices.rolling(26).max())
+
+
+@pytest.mark.parametrize("window", [1, 2, 9, 26, 499, 500, 501])
+def test_rolling_extrema_matches_pandas(window):
+    prices = pd.DataFrame(np.random.RandomState(0).randn(500, 3).cumsum(axis=0))
+    prices.iloc[[100, 101, 300], 1] = np.nan
+    mins, maxs = rolling_extrema(prices.values, window)
+    np.testing.assert_array_equal(mins, prices.rolling(window).min().values)
+    np.testing.assert_array_equal(maxs, prices.rolling(window).max().values)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("shape", [(300,), (300, 2)])
+def test_rolling_min_max_backends(backend, shape):
+    prices = np.random.RandomState(1).randn(*shape).cumsum(axis=0)
+    prices[50] = np.nan
+    expected = pd.DataFrame(prices.reshape(len(prices), -1)).rolling(9)
+    mins, maxs = rolling_min_max(prices, 9, backend=backend)
+    assert mins.shape == maxs.shape == shape
+    np.testing.assert_array_equal(mins.reshape(len(prices), -1), expected.min().values)
+    np.testing.assert_array_equal(maxs.reshape(len(prices), -1), expected.max().values)
+
+
+def test_rolling_min_max_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        rolling_min_max(np.arange(10.0), 3, backend='numba')
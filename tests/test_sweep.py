@@ -0,0 +1,26 @@
+import pytest
+import pandas as pd
+from ..forex_toolbox.indicators.ikh import lines_data, mark_signal
+from ..forex_toolbox.indicators.sweep import parameter_grid, sweep
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_sweep_matches_mark_signal(processes):
+    price = pd.read_csv("fixtures/ikh_price.csv").price
+    grid = parameter_grid(turn=[5, 9], base=[20, 26], displacement=[0, 26], max_cloud_thickness=[1.0, 1.5])
+    table = sweep(price, grid, processes=processes, chunksize=3)
+
+    assert len(table) == len(grid)
+    for params, row in zip(grid, table.itertuples()):
+        data = mark_signal(lines_data(price, params['turn'], params['base'], params['lag_span'],
+                                      params['displacement']))
+        assert row.turn == params['turn']
+        assert row.max_cloud_thickness == params['max_cloud_thickness']
+        assert row.buys == data.buy.sum()
+        assert row.sells == data.sell.sum()
+    assert table.buys.sum() > 0
+
+
+def test_parameter_grid_rejects_unknown_parameters():
+    with pytest.raises(ValueError):
+        parameter_grid(tenkan=[9])